@@ -0,0 +1,91 @@
+"""Benchmark CLI startup time and event loop throughput.
+
+Usage::
+
+    python benchmarks/bench_loop.py [--clients 1000] [--frames 50] [--runs 10]
+
+Startup: wall time of `python -m pygrowcube.cli --help` and of the
+`import pygrowcube.cli` alone.
+
+Throughput: a local fake GrowCube streams reading frames to many
+MessageClients at once, run on each available loop backend. Reports frames
+decoded per second.
+"""
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+from time import perf_counter
+
+from pygrowcube import loop
+from pygrowcube.messageclient import MessageClient
+from pygrowcube.timeouthelper import TimeoutHelper
+
+READING = b"elea21#10#0@45@21@19#"
+
+
+def time_command(args, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = perf_counter()
+        subprocess.run(args, check=True, stdout=subprocess.DEVNULL)
+        times.append(perf_counter() - start)
+    return statistics.median(times)
+
+
+def bench_startup(runs: int):
+    help_time = time_command([sys.executable, "-m", "pygrowcube.cli", "--help"], runs)
+    import_time = time_command([sys.executable, "-c", "import pygrowcube.cli"], runs)
+    bare_time = time_command([sys.executable, "-c", "pass"], runs)
+    print(f"python startup               {bare_time * 1000:8.1f} ms")
+    print(f"import pygrowcube.cli        {import_time * 1000:8.1f} ms")
+    print(f"pygrowcube --help            {help_time * 1000:8.1f} ms")
+
+
+async def stream_frames(clients: int, frames: int) -> float:
+    async def fake_growcube(reader, writer):
+        writer.write(READING * frames)
+        await writer.drain()
+        await reader.read()  # until the client closes
+        writer.close()
+
+    server = await asyncio.start_server(fake_growcube, "127.0.0.1", 0, backlog=4096)
+    port = server.sockets[0].getsockname()[1]
+
+    async def client():
+        message_client = MessageClient("127.0.0.1", port)
+        await message_client.connect()
+        timeout = TimeoutHelper(60)
+        for _ in range(frames):
+            await message_client.receive_message(timeout)
+        await message_client.close()
+
+    async with server:
+        start = perf_counter()
+        await asyncio.gather(*(client() for _ in range(clients)))
+        return perf_counter() - start
+
+
+def bench_throughput(clients: int, frames: int):
+    for backend in (loop.ASYNCIO, loop.UVLOOP):
+        if backend == loop.UVLOOP and loop.uvloop is None:
+            print("uvloop                       not installed")
+            continue
+        elapsed = loop.run(stream_frames(clients, frames), backend)
+        rate = clients * frames / elapsed
+        print(f"{backend:<28} {rate:8.0f} frames/s ({elapsed:.2f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+    bench_startup(args.runs)
+    bench_throughput(args.clients, args.frames)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""Fleet-wide moisture analytics over SENSOR_HISTORY_ENTRY data.
+
+History for the whole fleet is held in a single float array shaped
+(cubes, days, 24, channels) with NaN where there is no reading, and every
+statistic is computed with batched NumPy operations over that array.
+WATERING_HISTORY_ENTRY events go in a matching boolean array (see
+watering_array) and give the time of the last watering; channels without
+any events fall back to looking for a rise in moisture.
+Requires NumPy.
+"""
+import logging
+import warnings
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy
+
+logger = logging.getLogger(__name__)
+
+CHANNELS = 4
+WATERING_RISE = 5  # without watering events, a rise of 5% or more is taken as one
+DRYING_WINDOW = 48  # hours of history used to estimate the drying rate
+
+# One channel of one cube, as returned by rank_channels
+ChannelForecast = namedtuple(
+    "ChannelForecast",
+    [
+        "device",
+        "channel",
+        "moisture",
+        "hours_since_watering",
+        "drying_rate",
+        "hours_until_minimum",
+    ],
+)
+
+
+def history_array(histories: dict, end_date=None, days: int = None):
+    """Build the fleet history array from SensorHistory entries.
+
+    Args:
+        histories (dict): device id -> iterable of SensorHistory.
+        end_date (date): Last day in the array. Defaults to the latest entry.
+        days (int): Number of days in the array. Defaults to the span of the entries.
+    Returns:
+        tuple: (devices, dates, array) where array is shaped
+        (len(devices), len(dates), 24, CHANNELS) with NaN for missing hours.
+    """
+    devices = list(histories)
+    entries = [
+        (d, entry) for d, device in enumerate(devices) for entry in histories[device]
+    ]
+    if end_date is None:
+        end_date = max((entry.date for _, entry in entries), default=None)
+    if end_date is None:
+        return devices, [], numpy.full((len(devices), 0, 24, CHANNELS), numpy.nan)
+    if days is None:
+        start_date = min(entry.date for _, entry in entries)
+        days = (end_date - start_date).days + 1
+    dates = [end_date - timedelta(days=days - 1 - i) for i in range(days)]
+
+    array = numpy.full((len(devices), days, 24, CHANNELS), numpy.nan)
+    if entries:
+        cube_index = numpy.array([d for d, _ in entries])
+        day_index = numpy.array(
+            [days - 1 - (end_date - e.date).days for _, e in entries]
+        )
+        channel_index = numpy.array([e.channel for _, e in entries])
+        values = numpy.array([e.moistures for _, e in entries], dtype=float)
+        keep = (day_index >= 0) & (day_index < days) & (channel_index < CHANNELS)
+        # GrowCube reports hours without a reading as 00
+        values[values == 0] = numpy.nan
+        array[cube_index[keep], day_index[keep], :, channel_index[keep]] = values[keep]
+    return devices, dates, array
+
+
+def watering_array(waterings: dict, devices, dates):
+    """Mark the hours with a watering, in the same layout as history_array.
+
+    Args:
+        waterings (dict): device id -> iterable of WateringEvent.
+        devices: Device ids, as returned by history_array.
+        dates: Dates, as returned by history_array.
+    Returns:
+        Boolean array shaped (len(devices), len(dates), 24, CHANNELS).
+    """
+    days = len(dates)
+    array = numpy.zeros((len(devices), days, 24, CHANNELS), dtype=bool)
+    device_index = {device: d for d, device in enumerate(devices)}
+    events = [
+        (device_index[device], event)
+        for device, device_events in waterings.items()
+        if device in device_index
+        for event in device_events
+    ]
+    if events and days:
+        cube_index = numpy.array([d for d, _ in events])
+        day_index = numpy.array(
+            [days - 1 - (dates[-1] - e.time.date()).days for _, e in events]
+        )
+        hour_index = numpy.array([e.time.hour for _, e in events])
+        channel_index = numpy.array([e.channel for _, e in events])
+        keep = (day_index >= 0) & (day_index < days) & (channel_index < CHANNELS)
+        array[
+            cube_index[keep], day_index[keep], hour_index[keep], channel_index[keep]
+        ] = True
+    return array
+
+
+def _hourly(history):
+    """(cubes, days, 24, channels) -> (cubes, hours, channels)"""
+    cubes, days, hours, channels = history.shape
+    return history.reshape(cubes, days * hours, channels)
+
+
+def daily_stats(history) -> tuple:
+    """Return (min, mean, max) moisture per cube, day and channel.
+
+    Each is shaped (cubes, days, channels); days without readings are NaN.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)  # all-NaN days
+        return (
+            numpy.nanmin(history, axis=2),
+            numpy.nanmean(history, axis=2),
+            numpy.nanmax(history, axis=2),
+        )
+
+
+def _last_index(mask):
+    """Index of the last True along axis 1 of (cubes, hours, channels), -1 if none."""
+    hours = mask.shape[1]
+    last = hours - 1 - numpy.argmax(mask[:, ::-1, :], axis=1)
+    return numpy.where(mask.any(axis=1), last, -1)
+
+
+def _now_index(hourly):
+    """Last hour with a reading anywhere in the fleet."""
+    has_reading = ~numpy.isnan(hourly).all(axis=(0, 2))
+    return int(numpy.nonzero(has_reading)[0][-1]) if has_reading.any() else -1
+
+
+def _watering_indexes(history, rise: float, waterings):
+    """Return (hour of the last watering, first hour whose reading follows it).
+
+    Channels with watering events use the latest event. A reading in the same
+    hour may predate it, so drying starts from the next hour. Other channels
+    fall back to the last rise in moisture, whose reading is already watered.
+    """
+    risen = _last_rise_index(history, rise)
+    if waterings is None:
+        return risen, risen
+    events = _hourly(waterings)
+    has_events = events.any(axis=1)
+    watered = _last_index(events)
+    return (
+        numpy.where(has_events, watered, risen),
+        numpy.where(has_events, watered + 1, risen),
+    )
+
+
+def last_watering_index(history, rise: float = WATERING_RISE, waterings=None):
+    """Hour index (into the flattened days x 24 axis) of the last watering, -1 if none.
+
+    Args:
+        history: Fleet history array.
+        rise (float): Moisture rise taken as a watering for channels without events.
+        waterings: Optional array from watering_array.
+    """
+    return _watering_indexes(history, rise, waterings)[0]
+
+
+def _last_rise_index(history, rise: float):
+    hourly = _hourly(history)
+    # Compare each reading with the previous reading, skipping missing hours
+    filled = _forward_fill(hourly)
+    rises = numpy.zeros(hourly.shape, dtype=bool)
+    rises[:, 1:, :] = (filled[:, 1:, :] - filled[:, :-1, :]) >= rise
+    rises &= ~numpy.isnan(hourly)
+    return _last_index(rises)
+
+
+def _forward_fill(hourly):
+    valid = ~numpy.isnan(hourly)
+    index = numpy.where(valid, numpy.arange(hourly.shape[1])[None, :, None], 0)
+    numpy.maximum.accumulate(index, axis=1, out=index)
+    return numpy.take_along_axis(hourly, index, axis=1)
+
+
+def hours_since_watering(
+    history, rise: float = WATERING_RISE, now: int = None, waterings=None
+):
+    """Hours since the last watering per cube and channel; NaN if none in the history.
+
+    now is the hour index to measure from, defaulting to the latest reading in the fleet.
+    """
+    hourly = _hourly(history)
+    now = _now_index(hourly) if now is None else now
+    last = last_watering_index(history, rise, waterings)
+    return numpy.where(last >= 0, now - last, numpy.nan)
+
+
+def drying_rate(
+    history, window: int = DRYING_WINDOW, rise: float = WATERING_RISE, waterings=None
+):
+    """Moisture lost per hour per cube and channel since the last watering.
+
+    A least squares slope over at most the last `window` hours of readings after
+    the last watering. Positive means drying. NaN with fewer than 2 readings.
+    """
+    hourly = _hourly(history)
+    hours = numpy.arange(hourly.shape[1], dtype=float)[None, :, None]
+    valid = ~numpy.isnan(hourly)
+    last_reading = _last_index(valid)
+    watered = _watering_indexes(history, rise, waterings)[1]
+    start = numpy.maximum(watered, last_reading - window + 1)
+    mask = valid & (hours >= start[:, None, :]) & (hours <= last_reading[:, None, :])
+
+    n = mask.sum(axis=1)
+    x = numpy.where(mask, hours, 0.0)
+    y = numpy.where(mask, hourly, 0.0)
+    sum_x, sum_y = x.sum(axis=1), y.sum(axis=1)
+    sxx = (x * x).sum(axis=1) - sum_x * sum_x / numpy.maximum(n, 1)
+    sxy = (x * y).sum(axis=1) - sum_x * sum_y / numpy.maximum(n, 1)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        slope = sxy / sxx
+    return numpy.where((n >= 2) & (sxx > 0), -slope, numpy.nan)
+
+
+def current_moisture(history):
+    """Latest reading per cube and channel, NaN if none."""
+    hourly = _hourly(history)
+    last = _last_index(~numpy.isnan(hourly))
+    index = numpy.maximum(last, 0)[:, None, :]
+    values = numpy.take_along_axis(hourly, index, axis=1)[:, 0, :]
+    return numpy.where(last >= 0, values, numpy.nan)
+
+
+def hours_until_minimum(
+    history,
+    minimums,
+    window: int = DRYING_WINDOW,
+    rise: float = WATERING_RISE,
+    waterings=None,
+):
+    """Projected hours until each channel dries to its smart watering minimum.
+
+    Args:
+        history: Fleet history array.
+        minimums: Minimum moisture, broadcastable to (cubes, channels).
+    Returns:
+        Array (cubes, channels). 0 if already at or below the minimum, inf if
+        not drying, NaN if there is no reading.
+    """
+    moisture = current_moisture(history)
+    rate = drying_rate(history, window, rise, waterings)
+    headroom = moisture - numpy.broadcast_to(
+        numpy.asarray(minimums, dtype=float), moisture.shape
+    )
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        hours = numpy.where(rate > 0, headroom / rate, numpy.inf)
+    hours = numpy.where(headroom <= 0, 0.0, hours)
+    return numpy.where(numpy.isnan(moisture), numpy.nan, hours)
+
+
+def rank_channels(
+    devices,
+    history,
+    minimums,
+    limit: int = None,
+    window: int = DRYING_WINDOW,
+    rise: float = WATERING_RISE,
+    waterings=None,
+) -> list:
+    """Return ChannelForecasts for the fleet, soonest to reach its minimum first.
+
+    Channels without readings are left out.
+    """
+    until = hours_until_minimum(history, minimums, window, rise, waterings)
+    since = hours_since_watering(history, rise, waterings=waterings)
+    rate = drying_rate(history, window, rise, waterings)
+    moisture = current_moisture(history)
+
+    flat = until.ravel()
+    order = numpy.argsort(
+        numpy.where(numpy.isnan(flat), numpy.inf, flat), kind="stable"
+    )
+    order = order[~numpy.isnan(flat[order])]
+    if limit is not None:
+        order = order[:limit]
+    cube, channel = numpy.unravel_index(order, until.shape)
+    return [
+        ChannelForecast(
+            devices[c],
+            int(ch),
+            float(moisture[c, ch]),
+            float(since[c, ch]),
+            float(rate[c, ch]),
+            float(until[c, ch]),
+        )
+        for c, ch in zip(cube.tolist(), channel.tolist())
+    ]
@@ -1,8 +1,11 @@
-"""Console script for pygrowcube."""
-import asyncio
+"""Console script for pygrowcube.
+
+The library (and asyncio) is imported inside each command rather than at
+module load, so --help and argument errors return without paying for it.
+"""
+import importlib.util
 import sys
 import click
-from pygrowcube.pygrowcube import get_status  # , get_history
 import logging
 
 
@@ -24,6 +27,33 @@ def setup_logging(verbose, debug, log, logfilename):
         )
 
 
+def check_loop_backend(ctx, param, value):
+    """Reject --loop uvloop before any work is done if uvloop isn't installed."""
+    if value == "uvloop" and importlib.util.find_spec("uvloop") is None:
+        raise click.BadParameter(
+            "uvloop is not installed. Install it with: pip install pygrowcube[uvloop]"
+        )
+    return value
+
+
+def run(coroutine, command, profile, trace_malloc, loop_backend):
+    """Run a command's coroutine on the chosen loop, profiling it if requested."""
+    from pygrowcube.loop import run as run_on_loop
+
+    if not (profile or trace_malloc):
+        return run_on_loop(coroutine, loop_backend)
+    from pygrowcube.profiling import profile_session
+
+    with profile_session(
+        f"pygrowcube-{command}",
+        cprofile=profile,
+        trace_malloc=trace_malloc,
+        task_timing=False,
+    ) as session:
+        setup = session.instrument_loop if profile else None
+        return run_on_loop(coroutine, loop_backend, setup)
+
+
 @click.group()
 def main():
     """CLI group to handle multiple commands."""
@@ -47,11 +77,48 @@ def main():
 @click.option(
     "--logfilename", type=str, default="growcube.log", help="Specify log file name."
 )
-def connect(ip_address, timeout, verbose, debug, log, logfilename):
+@click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help="Write cProfile and per-coroutine timings to pygrowcube-<command>.* files.",
+)
+@click.option(
+    "--trace-malloc",
+    is_flag=True,
+    default=False,
+    help="Write the top memory allocations to pygrowcube-<command>.alloc.txt.",
+)
+@click.option(
+    "--loop",
+    "loop_backend",
+    type=click.Choice(["auto", "uvloop", "asyncio"]),
+    default="auto",
+    show_default=True,
+    callback=check_loop_backend,
+    help="Event loop to run on. auto uses uvloop when it is installed.",
+)
+def connect(
+    ip_address,
+    timeout,
+    verbose,
+    debug,
+    log,
+    logfilename,
+    profile,
+    trace_malloc,
+    loop_backend,
+):
     """Handle the connect command."""
+    from pygrowcube.pygrowcube import get_status
+
     setup_logging(verbose, debug, log, logfilename)
-    status = asyncio.run(
-        get_status(ip_address, timeout, wait_for_sensor_readings=False)
+    status = run(
+        get_status(ip_address, timeout, wait_for_sensor_readings=False),
+        "connect",
+        profile,
+        trace_malloc,
+        loop_backend,
     )
     click.echo(str(status))
     return 0
@@ -74,10 +141,45 @@ def connect(ip_address, timeout, verbose, debug, log, logfilename):
 @click.option(
     "--logfilename", type=str, default="growcube.log", help="Specify log file name."
 )
-def status(ip_address, timeout, verbose, debug, log, logfilename):
+@click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help="Write cProfile and per-coroutine timings to pygrowcube-<command>.* files.",
+)
+@click.option(
+    "--trace-malloc",
+    is_flag=True,
+    default=False,
+    help="Write the top memory allocations to pygrowcube-<command>.alloc.txt.",
+)
+@click.option(
+    "--loop",
+    "loop_backend",
+    type=click.Choice(["auto", "uvloop", "asyncio"]),
+    default="auto",
+    show_default=True,
+    callback=check_loop_backend,
+    help="Event loop to run on. auto uses uvloop when it is installed.",
+)
+def status(
+    ip_address,
+    timeout,
+    verbose,
+    debug,
+    log,
+    logfilename,
+    profile,
+    trace_malloc,
+    loop_backend,
+):
     """Handle the status command."""
+    from pygrowcube.pygrowcube import get_status
+
     setup_logging(verbose, debug, log, logfilename)
-    status = asyncio.run(get_status(ip_address, timeout))
+    status = run(
+        get_status(ip_address, timeout), "status", profile, trace_malloc, loop_backend
+    )
     click.echo(str(status))
     return 0
 
@@ -87,9 +189,9 @@ def status(ip_address, timeout, verbose, debug, log, logfilename):
 @click.option(
     "--timeout",
     "-t",
-    default=15,
+    default=60,
     show_default=True,
-    help="Maximum time to wait for readings in seconds. GrowCube typically sends readings within 10s.",
+    help="Maximum time to wait for the history of all channels in seconds.",
 )
 @click.option(
     "--channel",
@@ -105,10 +207,143 @@ def status(ip_address, timeout, verbose, debug, log, logfilename):
 @click.option(
     "--logfilename", type=str, default="growcube.log", help="Specify log file name."
 )
-def history(ip_address, timeout, channel, verbose, debug, log, logfilename):
+@click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help="Write cProfile and per-coroutine timings to pygrowcube-<command>.* files.",
+)
+@click.option(
+    "--trace-malloc",
+    is_flag=True,
+    default=False,
+    help="Write the top memory allocations to pygrowcube-<command>.alloc.txt.",
+)
+@click.option(
+    "--loop",
+    "loop_backend",
+    type=click.Choice(["auto", "uvloop", "asyncio"]),
+    default="auto",
+    show_default=True,
+    callback=check_loop_backend,
+    help="Event loop to run on. auto uses uvloop when it is installed.",
+)
+def history(
+    ip_address,
+    timeout,
+    channel,
+    verbose,
+    debug,
+    log,
+    logfilename,
+    profile,
+    trace_malloc,
+    loop_backend,
+):
     """Handle the history command with an optional channel number."""
+    from pygrowcube.pygrowcube import get_history
+
+    setup_logging(verbose, debug, log, logfilename)
+    channels = [channel] if channel is not None else [0, 1, 2, 3]
+    histories = run(
+        get_history(ip_address, channels, timeout_in_seconds=timeout),
+        "history",
+        profile,
+        trace_malloc,
+        loop_backend,
+    )
+    for channel_history in histories.values():
+        click.echo(str(channel_history))
+    return 0
+
+
+@main.command()
+@click.argument("ip_addresses", nargs=-1, required=True)
+@click.option(
+    "--port",
+    "-p",
+    default=9808,
+    show_default=True,
+    help="Port to serve /metrics and /status.json on.",
+)
+@click.option(
+    "--ttl",
+    default=30,
+    show_default=True,
+    help="Seconds to serve a cached status before reading the GrowCube again.",
+)
+@click.option(
+    "--stale-ttl",
+    default=300,
+    show_default=True,
+    help="Seconds to keep serving an old status while it is being refreshed.",
+)
+@click.option(
+    "--allow-any-target",
+    is_flag=True,
+    default=False,
+    help="Accept ?target= addresses other than IP_ADDRESSES. Only use on a trusted network.",
+)
+@click.option(
+    "--timeout",
+    "-t",
+    default=15,
+    show_default=True,
+    help="Maximum time to wait for readings in seconds. GrowCube typically sends readings within 10s.",
+)
+@click.option(
+    "--verbose", "-v", is_flag=True, default=False, help="Enable verbose output."
+)
+@click.option("--debug", is_flag=True, default=False, help="Enable debug mode.")
+@click.option("--log", is_flag=True, default=False, help="Enable logging.")
+@click.option(
+    "--logfilename", type=str, default="growcube.log", help="Specify log file name."
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help="Write cProfile and per-coroutine timings to pygrowcube-<command>.* files.",
+)
+@click.option(
+    "--trace-malloc",
+    is_flag=True,
+    default=False,
+    help="Write the top memory allocations to pygrowcube-<command>.alloc.txt.",
+)
+@click.option(
+    "--loop",
+    "loop_backend",
+    type=click.Choice(["auto", "uvloop", "asyncio"]),
+    default="auto",
+    show_default=True,
+    callback=check_loop_backend,
+    help="Event loop to run on. auto uses uvloop when it is installed.",
+)
+def export(
+    ip_addresses,
+    port,
+    ttl,
+    stale_ttl,
+    allow_any_target,
+    timeout,
+    verbose,
+    debug,
+    log,
+    logfilename,
+    profile,
+    trace_malloc,
+    loop_backend,
+):
+    """Serve the status of the GrowCubes at IP_ADDRESSES over HTTP."""
+    from pygrowcube.exporter import MetricsExporter, StatusCache
+
     setup_logging(verbose, debug, log, logfilename)
-    # Implement the history checking logic here, possibly using get_history
+    cache = StatusCache(ttl=ttl, stale_ttl=stale_ttl, timeout=timeout)
+    exporter = MetricsExporter(
+        ip_addresses, cache, port=port, allow_any_target=allow_any_target
+    )
+    run(exporter.serve_forever(), "export", profile, trace_malloc, loop_backend)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,289 @@
+"""Declarative smart watering configuration for a fleet of GrowCubes.
+
+A plan maps channel numbers to the ChannelSettings wanted on that channel (or
+None to delete its settings). ConfigSync remembers what was last applied to
+each device, keyed by the device id GrowCube reports in its VERSION message,
+and only sends commands for channels whose settings have changed. Devices
+whose plan already matches are not contacted at all.
+"""
+import asyncio
+import json
+import logging
+import os
+from collections import namedtuple
+from time import monotonic
+
+from .message import Message, MessageType
+from .messageclient import MessageClient
+from .pygrowcube import PORT
+from .timeouthelper import TimeoutHelper
+
+logger = logging.getLogger(__name__)
+
+# ChannelSettings.mode values, as sent in REQUEST_CHANNEL_SETTINGS
+REGULAR = 1  # water every `first` for `second` seconds
+SMART_OUTSIDE_SUNLIGHT = 2  # keep moisture between first% and second%, not in sunlight
+SMART = 3  # keep moisture between first% and second%
+
+CONFIG_TIMEOUT = 15  # seconds to apply a plan to one device
+ACK_TIMEOUT = 2  # seconds to wait for GrowCube to acknowledge a command
+COMMAND_INTERVAL = 0.5  # minimum seconds between commands to the same device
+MAX_CONCURRENT = 20  # devices configured at once
+
+# Recorded for a channel whose command was not acknowledged. It never matches a
+# plan, so the settings are sent again on the next sync.
+UNCONFIRMED = "unconfirmed"
+
+ChannelSettings = namedtuple("ChannelSettings", ["mode", "first", "second"])
+
+
+class SettingsNotAcknowledged(Exception):
+    """GrowCube did not acknowledge the settings for some channels.
+
+    Attributes:
+        channels (list): Channels that were not acknowledged.
+        applied (int): Channels that were changed and acknowledged.
+    """
+
+    def __init__(self, host: str, channels: list, applied: int):
+        super().__init__(f"{host} did not acknowledge settings for channels {channels}")
+        self.channels = channels
+        self.applied = applied
+
+
+def smart(min_moisture: int, max_moisture: int) -> ChannelSettings:
+    return ChannelSettings(SMART, min_moisture, max_moisture)
+
+
+def smart_outside_sunlight(min_moisture: int, max_moisture: int) -> ChannelSettings:
+    return ChannelSettings(SMART_OUTSIDE_SUNLIGHT, min_moisture, max_moisture)
+
+
+def regular(interval, duration) -> ChannelSettings:
+    return ChannelSettings(REGULAR, interval, duration)
+
+
+def settings_messages(channel: int, settings: ChannelSettings) -> list:
+    """Return the Messages that apply settings (None = delete) to a channel."""
+    if settings is None:
+        return [
+            Message(
+                message_type=MessageType.REQUEST_DELETE, message_content=str(channel)
+            ),
+            Message(
+                message_type=MessageType.REQUEST_DELETE_CONFIRM,
+                message_content=str(channel),
+            ),
+        ]
+    return [
+        Message(
+            message_type=MessageType.REQUEST_CHANNEL_SETTINGS,
+            message_content=f"{channel}@{settings.mode}@{settings.first}@{settings.second}",
+        )
+    ]
+
+
+def diff_plan(applied: dict, plan: dict) -> dict:
+    """Return {channel: settings} for the channels in plan that differ from applied.
+
+    A channel deleted with None counts as unchanged if it was never set.
+    """
+    return {
+        channel: settings
+        for channel, settings in plan.items()
+        if applied.get(channel) != settings
+    }
+
+
+class SettingsCache:
+    """Last-applied settings per device id, optionally persisted as JSON.
+
+    Args:
+        path (str): File to load from and save to. None keeps it in memory only.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.applied = {}  # device id -> {channel: ChannelSettings}
+        self.device_ids = {}  # host -> device id last seen there
+        if path and os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            self.device_ids = data.get("device_ids", {})
+            self.applied = {
+                device: {
+                    int(channel): (
+                        ChannelSettings(*settings)
+                        if isinstance(settings, list)
+                        else settings
+                    )
+                    for channel, settings in channels.items()
+                }
+                for device, channels in data.get("applied", {}).items()
+            }
+
+    def get(self, device_id: str) -> dict:
+        return self.applied.get(device_id, {})
+
+    def update(self, device_id: str, changes: dict):
+        self.applied.setdefault(device_id, {}).update(changes)
+
+    def save(self):
+        if not self.path:
+            return
+        data = {
+            "device_ids": self.device_ids,
+            "applied": {
+                device: {
+                    str(channel): (
+                        list(settings)
+                        if isinstance(settings, ChannelSettings)
+                        else settings
+                    )
+                    for channel, settings in channels.items()
+                }
+                for device, channels in self.applied.items()
+            },
+        }
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(self.path + ".tmp", self.path)
+
+
+class ConfigSync:
+    """Apply watering plans to many GrowCubes concurrently.
+
+    Args:
+        cache (SettingsCache): Record of settings already applied.
+        max_concurrent (int): Devices configured at the same time.
+        command_interval (float): Minimum seconds between commands to one device.
+        timeout (float): Seconds allowed to configure each device.
+    """
+
+    def __init__(
+        self,
+        cache: SettingsCache = None,
+        max_concurrent: int = MAX_CONCURRENT,
+        command_interval: float = COMMAND_INTERVAL,
+        timeout: float = CONFIG_TIMEOUT,
+        port: int = PORT,
+    ):
+        self.cache = cache or SettingsCache()
+        self.max_concurrent = max_concurrent
+        self.command_interval = command_interval
+        self.timeout = timeout
+        self.port = port
+        self.commands_sent = 0
+
+    async def _wait_for(self, client, message_type, timeout: TimeoutHelper):
+        while not timeout.timed_out:
+            response = await client.receive_message(timeout)
+            if isinstance(response, Message) and response.message_type == message_type:
+                return response
+        return None
+
+    async def _send_command(
+        self, client, messages: list, last_sent: float, timeout: TimeoutHelper
+    ) -> float:
+        wait = last_sent + self.command_interval - monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        await client.send_messages(messages, timeout)
+        self.commands_sent += 1
+        return monotonic()
+
+    async def apply(self, host: str, plan: dict) -> int:
+        """Apply a plan to the GrowCube at host. Returns the number of channels changed.
+
+        Raises:
+            SettingsNotAcknowledged: Some commands were not acknowledged. Those
+                channels are sent again on the next sync.
+        """
+        known_id = self.cache.device_ids.get(host)
+        if known_id is not None and not diff_plan(self.cache.get(known_id), plan):
+            logger.debug("Settings for %s (%s) already applied", host, known_id)
+            return 0
+
+        client = MessageClient(host, self.port)
+        timeout = TimeoutHelper(self.timeout)
+        try:
+            await client.connect()
+            await client.send_message(
+                Message(
+                    message_type=MessageType.REQUEST_HELLO,
+                    message_content=Message.format_datetime_for_growcube(),
+                ),
+                timeout,
+            )
+            version = await self._wait_for(client, MessageType.VERSION, timeout)
+            if version is None:
+                raise asyncio.TimeoutError(f"No VERSION received from {host}")
+            device_id = version.message_content.split("@")[-1]
+            self.cache.device_ids[host] = device_id
+
+            changes = diff_plan(self.cache.get(device_id), plan)
+            if not changes:
+                return 0
+
+            await client.send_message(
+                Message(message_type=MessageType.REQUEST_READY_FOR_COMMAND), timeout
+            )
+            if (
+                await self._wait_for(client, MessageType.READY_FOR_COMMAND, timeout)
+                is None
+            ):
+                raise asyncio.TimeoutError(f"{host} did not become ready for commands")
+
+            last_sent = 0.0
+            failed = []
+            for channel, settings in sorted(changes.items()):
+                messages = settings_messages(channel, settings)
+                last_sent = await self._send_command(
+                    client, messages, last_sent, timeout
+                )
+                # GrowCube sends an OK for every frame, e.g. both halves of a
+                # delete, so wait for all of them before the next command
+                ack = TimeoutHelper(min(ACK_TIMEOUT, max(timeout.remaining, 0)))
+                acks = 0
+                while acks < len(messages):
+                    if await self._wait_for(client, MessageType.OK, ack) is None:
+                        break
+                    acks += 1
+                if acks < len(messages):
+                    logger.warning(
+                        "No acknowledgement from %s for channel %s settings",
+                        host,
+                        channel,
+                    )
+                    failed.append(channel)
+                    self.cache.update(device_id, {channel: UNCONFIRMED})
+                else:
+                    self.cache.update(device_id, {channel: settings})
+            applied = len(changes) - len(failed)
+            if failed:
+                raise SettingsNotAcknowledged(host, failed, applied)
+            logger.info("Applied settings for channels %s to %s", sorted(changes), host)
+            return applied
+        finally:
+            await client.close()
+
+    async def sync(self, plans: dict) -> dict:
+        """Apply {host: plan} across the fleet.
+
+        Returns {host: channels changed, or the exception raised}. A
+        SettingsNotAcknowledged lists the channels that failed.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        async def one(host, plan):
+            async with semaphore:
+                try:
+                    return await self.apply(host, plan)
+                except Exception as e:
+                    logger.warning("Configuring %s failed: %s", host, e)
+                    return e
+
+        hosts = list(plans)
+        results = await asyncio.gather(*(one(host, plans[host]) for host in hosts))
+        self.cache.save()
+        return dict(zip(hosts, results))
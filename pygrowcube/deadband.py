@@ -0,0 +1,141 @@
+"""Change-detection filter for readings and Status updates.
+
+GrowCube pushes every channel every 10s whether or not anything changed and
+moisture values wander by +/-1. DeadbandFilter only lets an update through
+when a value moves by at least its deadband, a flag changes (sensor
+disconnected, outlet locked, out of water) or nothing has been emitted for the
+heartbeat interval.
+"""
+import logging
+from collections import Counter
+from time import time
+
+from .pygrowcube import Reading, Status
+
+logger = logging.getLogger(__name__)
+
+MOISTURE_DEADBAND = 2
+HUMIDITY_DEADBAND = 2
+TEMPERATURE_DEADBAND = 1
+HEARTBEAT = 300  # always emit at least every 5 minutes
+
+
+class DeadbandFilter:
+    """Suppress updates that don't differ meaningfully from the last one emitted.
+
+    Args:
+        moisture (float): Minimum change in moisture to emit.
+        humidity (float): Minimum change in humidity to emit.
+        temperature (float): Minimum change in temperature to emit.
+        heartbeat (float): Maximum seconds of silence for a key before an
+            unchanged update is emitted anyway. None disables the heartbeat.
+    """
+
+    def __init__(
+        self,
+        moisture: float = MOISTURE_DEADBAND,
+        humidity: float = HUMIDITY_DEADBAND,
+        temperature: float = TEMPERATURE_DEADBAND,
+        heartbeat: float = HEARTBEAT,
+    ):
+        self.moisture = moisture
+        self.humidity = humidity
+        self.temperature = temperature
+        self.heartbeat = heartbeat
+        self.emitted = Counter()
+        self.suppressed = Counter()
+        # key -> (time emitted, values, flags)
+        self._last = {}
+
+    def _check(self, key, now: float, values: tuple, deadbands: tuple, flags) -> str:
+        """Return why an update should be emitted, or None to suppress it."""
+        last = self._last.get(key)
+        if last is None:
+            reason = "first"
+        elif flags != last[2]:
+            reason = "flags"
+        elif any(
+            abs(value - previous) >= deadband
+            for value, previous, deadband in zip(values, last[1], deadbands)
+        ):
+            reason = "change"
+        elif self.heartbeat is not None and now - last[0] >= self.heartbeat:
+            reason = "heartbeat"
+        else:
+            return None
+        self._last[key] = (now, values, flags)
+        return reason
+
+    def _count(self, kind: str, reason: str) -> bool:
+        if reason is None:
+            self.suppressed[kind] += 1
+            return False
+        self.emitted[kind] += 1
+        self.emitted[reason] += 1
+        return True
+
+    def accept_reading(self, reading: Reading) -> bool:
+        """Return True if the reading should be passed downstream."""
+        reason = self._check(
+            ("reading", reading.device, reading.channel),
+            reading.timestamp,
+            (reading.moisture, reading.humidity, reading.temperature),
+            (self.moisture, self.humidity, self.temperature),
+            reading.flags,
+        )
+        return self._count("reading", reason)
+
+    def accept_status(self, status: Status, now: float = None) -> bool:
+        """Return True if the Status differs meaningfully from the last one emitted."""
+        now = time() if now is None else now
+        moistures = tuple(
+            status.moistures[channel] if status.refreshed_sensors[channel] else -1
+            for channel in range(4)
+        )
+        reason = self._check(
+            ("status", status.id or status.host),
+            now,
+            (status.humidity, status.temperature) + moistures,
+            (self.humidity, self.temperature) + (self.moisture,) * 4,
+            tuple(status.channel_flags(channel) for channel in range(4)),
+        )
+        return self._count("status", reason)
+
+    def accept(self, item, now: float = None) -> bool:
+        if isinstance(item, Reading):
+            return self.accept_reading(item)
+        return self.accept_status(item, now)
+
+    async def filter(self, stream):
+        """Async generator passing through only the items from stream that are accepted."""
+        async for item in stream:
+            if self.accept(item):
+                yield item
+
+    def forget(self, key):
+        """Drop state for a device so its next update is always emitted, e.g. after a reconnect."""
+        for stored in [k for k in self._last if k[1] == key]:
+            del self._last[stored]
+
+    def summary(self) -> dict:
+        emitted = self.emitted["reading"] + self.emitted["status"]
+        suppressed = sum(self.suppressed.values())
+        total = emitted + suppressed
+        return {
+            "emitted": emitted,
+            "suppressed": suppressed,
+            "suppressed_readings": self.suppressed["reading"],
+            "suppressed_statuses": self.suppressed["status"],
+            "by_reason": {
+                reason: self.emitted[reason]
+                for reason in ("first", "flags", "change", "heartbeat")
+            },
+            "reduction": suppressed / total if total else 0.0,
+        }
+
+    def __str__(self) -> str:
+        summary = self.summary()
+        return (
+            f"Deadband filter: emitted {summary['emitted']}, "
+            f"suppressed {summary['suppressed']} ({summary['reduction']:.0%})"
+        )
@@ -0,0 +1,312 @@
+"""HTTP exporter serving cached GrowCube status as Prometheus text and JSON.
+
+Several scrapers (Prometheus, Home Assistant etc.) hitting the exporter at the
+same time only ever cause one get_status call per GrowCube: results are cached
+per device for a TTL, concurrent requests share a single in-flight refresh and
+stale results are served while a refresh happens in the background.
+"""
+import asyncio
+import json
+import logging
+from time import monotonic
+from urllib.parse import parse_qs, urlsplit
+
+from .pygrowcube import STATUS_TIMEOUT, Status, get_status
+
+logger = logging.getLogger(__name__)
+
+EXPORTER_PORT = 9808
+CACHE_TTL = 30  # serve cached status without touching the device for 30s
+STALE_TTL = 300  # after the TTL, keep serving the old status while refreshing
+
+
+class _CacheEntry:
+    def __init__(self):
+        self.status = None
+        self.fetched_at = None
+        self.refresh = None  # in-flight asyncio.Task, shared by all waiters
+        self.last_error = None
+
+    def age(self, now: float) -> float:
+        return now - self.fetched_at if self.fetched_at is not None else None
+
+
+class StatusCache:
+    """Per-device TTL cache in front of get_status.
+
+    Args:
+        ttl (float): Seconds a status is served without refreshing.
+        stale_ttl (float): Seconds a status may be served while a background
+            refresh is in flight. Older entries make callers wait for the refresh.
+        timeout (float): Timeout passed to get_status.
+        fetch: Coroutine function used to read a device. Defaults to get_status.
+    """
+
+    def __init__(
+        self,
+        ttl: float = CACHE_TTL,
+        stale_ttl: float = STALE_TTL,
+        timeout: float = STATUS_TIMEOUT,
+        fetch=get_status,
+    ):
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.timeout = timeout
+        self.fetch = fetch
+        self.fetch_count = 0
+        self._entries = {}
+
+    def _entry(self, host: str) -> _CacheEntry:
+        entry = self._entries.get(host)
+        if entry is None:
+            entry = self._entries[host] = _CacheEntry()
+        return entry
+
+    def _start_refresh(self, host: str, entry: _CacheEntry) -> asyncio.Task:
+        if entry.refresh is None:
+            entry.refresh = asyncio.ensure_future(self._refresh(host, entry))
+        return entry.refresh
+
+    async def _refresh(self, host: str, entry: _CacheEntry) -> Status:
+        self.fetch_count += 1
+        try:
+            status = await self.fetch(host, self.timeout)
+            if status is None:
+                raise ConnectionError(f"No status received from GrowCube at {host}")
+            entry.status = status
+            entry.fetched_at = monotonic()
+            entry.last_error = None
+            return status
+        except Exception as e:
+            logger.warning("Refreshing status of %s failed: %s", host, e)
+            entry.last_error = e
+            raise
+        finally:
+            entry.refresh = None
+
+    async def get(self, host: str) -> Status:
+        """Return the status of the GrowCube at host, refreshing it if needed."""
+        entry = self._entry(host)
+        age = entry.age(monotonic())
+        if age is not None and age < self.ttl:
+            return entry.status
+        refresh = self._start_refresh(host, entry)
+        if age is not None and age < self.stale_ttl:
+            # Stale-while-revalidate: the refresh carries on in the background
+            refresh.add_done_callback(_consume_exception)
+            return entry.status
+        # shield so that a scraper disconnecting doesn't cancel the refresh for
+        # everyone else waiting on it
+        return await asyncio.shield(refresh)
+
+    def age(self, host: str) -> float:
+        """Seconds since the cached status for host was read, or None."""
+        entry = self._entries.get(host)
+        return entry.age(monotonic()) if entry else None
+
+
+def _consume_exception(task: asyncio.Task):
+    # The failure has already been logged in _refresh
+    if not task.cancelled():
+        task.exception()
+
+
+def status_to_dict(status: Status) -> dict:
+    return {
+        "id": status.id,
+        "host": status.host,
+        "version": status.version,
+        "temperature": status.temperature,
+        "humidity": status.humidity,
+        "moistures": list(status.moistures),
+        "sensor_warnings": [bool(w) for w in status.sensor_warnings],
+        "outlet_locks": [bool(lock) for lock in status.outlet_locks],
+        "has_water": status.has_water,
+        "refresh_complete": status.is_refresh_complete,
+    }
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_METRICS = [
+    ("growcube_up", "gauge", "1 if the GrowCube could be read"),
+    ("growcube_temperature_celsius", "gauge", "Temperature"),
+    ("growcube_humidity_percent", "gauge", "Relative humidity"),
+    ("growcube_moisture_percent", "gauge", "Soil moisture by channel"),
+    (
+        "growcube_sensor_disconnected",
+        "gauge",
+        "1 if the moisture sensor is disconnected",
+    ),
+    ("growcube_outlet_locked", "gauge", "1 if the water outlet is locked"),
+    ("growcube_has_water", "gauge", "0 if the water tank needs refilling"),
+    ("growcube_status_age_seconds", "gauge", "Age of the cached status"),
+]
+
+
+def format_prometheus(results: dict, ages: dict = None) -> str:
+    """Render {host: Status or None} in the Prometheus text exposition format."""
+    ages = ages or {}
+    samples = {name: [] for name, _, _ in _METRICS}
+    for host, status in results.items():
+        labels = f'host="{_escape_label(host)}"'
+        if status is None:
+            samples["growcube_up"].append((labels, 0))
+            continue
+        labels += f',device="{_escape_label(status.id)}"'
+        samples["growcube_up"].append((labels, 1))
+        samples["growcube_temperature_celsius"].append((labels, status.temperature))
+        samples["growcube_humidity_percent"].append((labels, status.humidity))
+        samples["growcube_has_water"].append((labels, int(bool(status.has_water))))
+        for channel in range(4):
+            channel_labels = f'{labels},channel="{channel}"'
+            if status.refreshed_sensors[channel]:
+                samples["growcube_moisture_percent"].append(
+                    (channel_labels, status.moistures[channel])
+                )
+            samples["growcube_sensor_disconnected"].append(
+                (channel_labels, int(bool(status.sensor_warnings[channel])))
+            )
+            samples["growcube_outlet_locked"].append(
+                (channel_labels, int(bool(status.outlet_locks[channel])))
+            )
+        if ages.get(host) is not None:
+            samples["growcube_status_age_seconds"].append(
+                (labels, round(ages[host], 3))
+            )
+
+    lines = []
+    for name, metric_type, description in _METRICS:
+        if not samples[name]:
+            continue
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.extend(f"{name}{{{labels}}} {value}" for labels, value in samples[name])
+    return "\n".join(lines) + "\n"
+
+
+def format_json(results: dict) -> str:
+    """Render {host: Status or None} as a JSON document keyed by host."""
+    return json.dumps(
+        {
+            host: status_to_dict(status) if status is not None else None
+            for host, status in results.items()
+        }
+    )
+
+
+class MetricsExporter:
+    """Minimal asyncio HTTP server exposing cached GrowCube status.
+
+    Endpoints:
+        /metrics: Prometheus text format
+        /status.json: JSON
+    Both accept ?target=<host> (repeatable) to select some of the configured
+    hosts, otherwise all configured hosts are reported.
+
+    Args:
+        allow_any_target (bool): Accept targets that are not in hosts. Anyone
+            who can reach the exporter can then make it connect to any address
+            on the GrowCube port, and every target is cached, so only enable
+            this on a trusted network.
+    """
+
+    def __init__(
+        self,
+        hosts,
+        cache: StatusCache = None,
+        host: str = "0.0.0.0",
+        port: int = EXPORTER_PORT,
+        allow_any_target: bool = False,
+    ):
+        self.hosts = list(hosts)
+        self.cache = cache or StatusCache()
+        self.host = host
+        self.port = port
+        self.allow_any_target = allow_any_target
+        self.server = None
+
+    async def collect(self, targets) -> dict:
+        async def one(target):
+            try:
+                return await self.cache.get(target)
+            except Exception:
+                return None
+
+        statuses = await asyncio.gather(*(one(target) for target in targets))
+        return dict(zip(targets, statuses))
+
+    async def render(self, path: str) -> tuple:
+        """Return (http status, content type, body) for a request path."""
+        url = urlsplit(path)
+        targets = parse_qs(url.query).get("target") or self.hosts
+        if url.path not in ("/metrics", "/status.json"):
+            return "404 Not Found", "text/plain; charset=utf-8", "Not found\n"
+        if not self.allow_any_target:
+            unknown = sorted(set(targets) - set(self.hosts))
+            if unknown:
+                return (
+                    "400 Bad Request",
+                    "text/plain; charset=utf-8",
+                    f"Unknown target: {', '.join(unknown)}\n",
+                )
+        if url.path == "/metrics":
+            results = await self.collect(targets)
+            ages = {target: self.cache.age(target) for target in targets}
+            return (
+                "200 OK",
+                "text/plain; version=0.0.4; charset=utf-8",
+                format_prometheus(results, ages),
+            )
+        results = await self.collect(targets)
+        return "200 OK", "application/json", format_json(results)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=10)
+            # Drain the headers - nothing in them is needed
+            while (await asyncio.wait_for(reader.readline(), timeout=10)) not in (
+                b"\r\n",
+                b"\n",
+                b"",
+            ):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) < 2 or parts[0] != "GET":
+                status, content_type, body = (
+                    "405 Method Not Allowed",
+                    "text/plain; charset=utf-8",
+                    "Only GET is supported\n",
+                )
+            else:
+                status, content_type, body = await self.render(parts[1])
+            payload = body.encode()
+            writer.write(
+                (
+                    f"HTTP/1.1 {status}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    "Connection: close\r\n\r\n"
+                ).encode()
+                + payload
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            logger.debug("Exporter client connection failed: %s", e)
+        finally:
+            writer.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port
+        )
+        logger.info("Exporter listening on %s:%s", self.host, self.port)
+        return self.server
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
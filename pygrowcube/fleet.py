@@ -0,0 +1,101 @@
+"""Collect status from a fleet of GrowCubes on a schedule."""
+import asyncio
+import inspect
+import logging
+from time import time
+
+from . import loop
+from .pygrowcube import STATUS_TIMEOUT, get_status
+from .scheduler import PollScheduler
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 60  # seconds between polls of each GrowCube
+
+
+class FleetCollector:
+    """Poll every GrowCube in a fleet, connecting just before each one's next
+    reading cycle, and pass each Status to a handler.
+
+    Args:
+        hosts: GrowCube addresses.
+        handler: Called with each Status read. May be a coroutine function, in
+            which case polling of that device waits for it to finish.
+        interval (float): Seconds between polls of each device.
+        scheduler (PollScheduler): Shared scheduler. Created if not given.
+        timeout (float): Timeout for each get_status call.
+        max_concurrent (int): Maximum connections open at once.
+    """
+
+    def __init__(
+        self,
+        hosts,
+        handler,
+        interval: float = POLL_INTERVAL,
+        scheduler: PollScheduler = None,
+        timeout: float = STATUS_TIMEOUT,
+        max_concurrent: int = 50,
+        fetch=get_status,
+    ):
+        self.hosts = list(hosts)
+        self.handler = handler
+        self.interval = interval
+        self.scheduler = scheduler or PollScheduler()
+        self.timeout = timeout
+        self.fetch = fetch
+        self.max_concurrent = max_concurrent
+        self.polls = 0
+        self.failures = 0
+        self.handler_errors = 0
+        self.poll_seconds = 0.0
+        self._semaphore = None
+
+    async def poll(self, host: str):
+        """Read one GrowCube now and pass the result to the handler."""
+        started = time()
+        async with self._semaphore:
+            try:
+                status = await self.fetch(
+                    host,
+                    self.timeout,
+                    message_callback=self.scheduler.message_callback(host),
+                )
+            except Exception as e:
+                logger.warning("Polling %s failed: %s", host, e)
+                status = None
+        self.polls += 1
+        self.poll_seconds += time() - started
+        if status is None:
+            self.failures += 1
+            return
+        try:
+            result = self.handler(status)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            self.handler_errors += 1
+            logger.exception("Handler failed for status of %s: %s", host, e)
+
+    async def _run_host(self, host: str, rounds: int = None):
+        earliest = time()
+        count = 0
+        while rounds is None or count < rounds:
+            when = self.scheduler.schedule(host, earliest)
+            await asyncio.sleep(max(0.0, when - time()))
+            self.scheduler.release(host)
+            await self.poll(host)
+            count += 1
+            earliest = when + self.interval
+
+    async def run(self, rounds: int = None):
+        """Poll the fleet until cancelled, or for the given number of rounds."""
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        await asyncio.gather(*(self._run_host(host, rounds) for host in self.hosts))
+
+    def run_forever(self, rounds: int = None, backend: str = loop.AUTO):
+        """Run the collector on a new event loop (uvloop if installed by default)."""
+        return loop.run(self.run(rounds), backend)
+
+    @property
+    def mean_poll_seconds(self) -> float:
+        return self.poll_seconds / self.polls if self.polls else 0.0
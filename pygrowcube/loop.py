@@ -0,0 +1,95 @@
+"""Selectable event loop backend.
+
+run() is a drop in replacement for asyncio.run that runs the coroutine on
+uvloop when it is installed (pip install pygrowcube[uvloop]) and on the
+standard asyncio loop otherwise. uvloop's libuv based sockets and transports
+handle thousands of concurrent GrowCube connections with noticeably less CPU.
+"""
+import asyncio
+import logging
+
+try:
+    import uvloop
+except ImportError:  # optional dependency
+    uvloop = None
+
+logger = logging.getLogger(__name__)
+
+AUTO = "auto"
+UVLOOP = "uvloop"
+ASYNCIO = "asyncio"
+BACKENDS = (AUTO, UVLOOP, ASYNCIO)
+
+
+def resolve_backend(backend: str = AUTO) -> str:
+    """Return the backend run() will use: uvloop or asyncio.
+
+    Args:
+        backend (str): "auto" (uvloop if installed), "uvloop" or "asyncio".
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown event loop backend {backend!r}, expected {BACKENDS}")
+    if backend == AUTO:
+        return UVLOOP if uvloop is not None else ASYNCIO
+    if backend == UVLOOP and uvloop is None:
+        raise RuntimeError("uvloop backend requested but uvloop is not installed")
+    return backend
+
+
+def new_event_loop(backend: str = AUTO) -> asyncio.AbstractEventLoop:
+    """Create a new event loop of the given backend."""
+    if resolve_backend(backend) == UVLOOP:
+        return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
+
+
+def _cancel_all_tasks(loop: asyncio.AbstractEventLoop):
+    tasks = [task for task in asyncio.all_tasks(loop) if not task.done()]
+    for task in tasks:
+        task.cancel()
+    if not tasks:
+        return
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    for task in tasks:
+        if not task.cancelled() and task.exception() is not None:
+            loop.call_exception_handler(
+                {
+                    "message": "unhandled exception during shutdown",
+                    "exception": task.exception(),
+                    "task": task,
+                }
+            )
+
+
+def run(coroutine, backend: str = AUTO, setup=None):
+    """Run a coroutine to completion on a new event loop, like asyncio.run.
+
+    Args:
+        coroutine: The coroutine to run.
+        backend (str): "auto", "uvloop" or "asyncio".
+        setup: Optional callable given the new loop before the coroutine
+            starts, e.g. ProfileSession.instrument_loop.
+
+    Returns:
+        The coroutine's result.
+    """
+    try:
+        loop = new_event_loop(backend)
+    except Exception:
+        coroutine.close()  # it will never run, so don't warn it was never awaited
+        raise
+    logger.debug("Running %s on %s", coroutine, type(loop).__module__)
+    try:
+        asyncio.set_event_loop(loop)
+        if setup is not None:
+            setup(loop)
+        return loop.run_until_complete(coroutine)
+    finally:
+        try:
+            _cancel_all_tasks(loop)
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            if hasattr(loop, "shutdown_default_executor"):
+                loop.run_until_complete(loop.shutdown_default_executor())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
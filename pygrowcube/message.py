@@ -1,5 +1,6 @@
 from datetime import datetime
 from enum import IntEnum
+from functools import lru_cache
 import logging
 
 
@@ -44,6 +45,12 @@ class MessageType(IntEnum):
     UNKNOWN = 0
 
 
+# Looked up for every message logged, so build the names once
+_READABLE_MESSAGE_TYPES = {
+    member.value: f"{member.value} {member.name}" for member in MessageType
+}
+
+
 class Message:
     def __init__(
         self,
@@ -68,10 +75,10 @@ class Message:
 
     @property
     def readable_message_type(self) -> str:
-        if self.message_type in MessageType.__members__.values():
-            return f"{self.message_type} {MessageType(self.message_type).name}"
-        else:
+        readable = _READABLE_MESSAGE_TYPES.get(self.message_type)
+        if readable is None:
             return f"{self.message_type} UNKNOWN"
+        return readable
 
     @property
     def content_expected_for_message_type(self) -> bool:
@@ -91,14 +98,16 @@ class Message:
         except ValueError as e:
             raise ValueError("Invalid datetime string format") from e
 
-    def format_datetime_for_growcube(dt=datetime.now()):
+    def format_datetime_for_growcube(dt=None):
         """
         Format a datetime object as a string in the format "YYYY@MM@DD@HH@mm@SS".
         Args:
-            dt (datetime): A datetime object to format.
+            dt (datetime): A datetime object to format. Defaults to now.
         Returns:
             str: The formatted datetime string.
         """
+        if dt is None:
+            dt = datetime.now()
         return dt.strftime("%Y@%m@%d@%H@%M@%S")
 
     def parse_message(self, message_string):
@@ -149,5 +158,180 @@ class Message:
         else:
             return f"ele{self.message_type}"
 
+    def encode(self) -> bytes:
+        """Return the message as the bytes to send to GrowCube."""
+        return encode_message(self.message_type, self.message_content)
+
     def __str__(self):
         return f"Message Type: {self.message_type}, Content Length: {self.content_length}, Content: {self.message_content}"
+
+
+# Message types whose content changes every time they are sent, so caching the
+# whole frame would just churn the cache
+VARIABLE_CONTENT_TYPES = {MessageType.REQUEST_HELLO}
+
+
+@lru_cache(maxsize=64)
+def _frame_header(message_type: int, content_length: int) -> bytes:
+    return f"elea{message_type}#{content_length}#".encode()
+
+
+@lru_cache(maxsize=256)
+def _constant_frame(message_type: int, message_content: str) -> bytes:
+    if message_type >= 500:
+        return f"ele{message_type}".encode()
+    return _frame_header(message_type, len(message_content)) + (
+        message_content.encode() + b"#"
+    )
+
+
+def encode_message(message_type: int, message_content: str = "") -> bytes:
+    """Encode a frame, reusing pre-encoded bytes for frames sent repeatedly
+    (e.g. elea43#1#2#, ele506) and a cached header for hello messages."""
+    if message_type is None:
+        raise ValueError("message_type not specified")
+    message_content = message_content or ""
+    if message_type in VARIABLE_CONTENT_TYPES:
+        content = message_content.encode()
+        return b"".join((_frame_header(int(message_type), len(content)), content, b"#"))
+    return _constant_frame(int(message_type), message_content)
+
+
+FRAME_MARKER = b"ele"
+MAX_TYPE_DIGITS = 4
+MAX_LENGTH_DIGITS = 4
+MAX_CONTENT_LENGTH = 1024
+
+
+class FrameDecoder:
+    """Incremental decoder for the stream of frames GrowCube sends.
+
+    feed() bytes as they arrive and call next_message() until it returns None.
+    Zero padding between frames is dropped. Anything else that is not part of
+    a well formed frame (a stray #, a corrupt header, a length that does not
+    match the content) is skipped up to the next "ele" marker, so one corrupt
+    frame costs that frame rather than the rest of the connection. Frames
+    split across reads are held until complete.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.skipped_bytes = 0  # total bytes discarded while resynchronising
+        self.resyncs = 0
+        self.last_skipped = b""  # bytes discarded by the latest resync
+
+    def feed(self, data: bytes):
+        self.buffer += data
+
+    def _skip(self, count: int):
+        skipped = bytes(self.buffer[:count])
+        del self.buffer[:count]
+        self.skipped_bytes += len(skipped)
+        self.resyncs += 1
+        self.last_skipped = skipped
+
+    def _resync(self, start: int = 1):
+        """Discard bytes up to the next frame marker at or after start."""
+        marker = self.buffer.find(FRAME_MARKER, start)
+        if marker == -1:
+            # Keep a trailing partial marker, e.g. "el", for the next read
+            marker = len(self.buffer)
+            for keep in (2, 1):
+                if self.buffer.endswith(FRAME_MARKER[:keep]):
+                    marker -= keep
+                    break
+        self._skip(marker)
+
+    def _field(self, start: int, max_digits: int):
+        """Return (value, end) for digits at start ending in #, None if more
+        data is needed, or raise ValueError if the field is corrupt."""
+        end = self.buffer.find(b"#", start, start + max_digits + 1)
+        if end == -1:
+            if len(self.buffer) - start > max_digits:
+                raise ValueError("field too long")
+            return None
+        field = bytes(self.buffer[start:end])
+        if not field.isdigit():
+            raise ValueError(f"not a number: {field!r}")
+        return int(field), end + 1
+
+    def _decode(self, final: bool):
+        """Decode a frame at the start of the buffer.
+
+        Returns (message, bytes used), None if more data is needed, or raises
+        ValueError if the data at the start of the buffer is not a frame.
+        """
+        buffer = self.buffer
+        if len(buffer) < 6:
+            return None
+        if buffer[3:4] != b"a":
+            # ele5XX: three digits, no length, content or trailing #
+            if not bytes(buffer[3:6]).isdigit():
+                raise ValueError("bad message type")
+            return Message(message_type=int(buffer[3:6])), 6
+
+        field = self._field(4, MAX_TYPE_DIGITS)
+        if field is None:
+            return None
+        message_type, length_start = field
+        message = Message(message_type=message_type)
+        if not message.content_expected_for_message_type:
+            return message, length_start
+
+        field = self._field(length_start, MAX_LENGTH_DIGITS)
+        if field is None:
+            return None
+        length, content_start = field
+        if length > MAX_CONTENT_LENGTH:
+            raise ValueError(f"content length {length} too long")
+        end = content_start + length
+        if buffer.find(b"#", content_start, end) != -1:
+            raise ValueError(f"content shorter than length {length}")
+        if len(buffer) < end + 1 and not (final and len(buffer) == end):
+            return None
+        used = end
+        if end < len(buffer):
+            terminator = buffer[end : end + 1]
+            if terminator == b"#":
+                used += 1
+            elif terminator != b"\x00" and not buffer.startswith(FRAME_MARKER, end):
+                raise ValueError(f"content longer than length {length}")
+            # else the trailing # is missing but padding or the next frame
+            # follows; next_message strips the padding
+        message.content_length = length
+        message.message_content = bytes(buffer[content_start:end]).decode(
+            errors="replace"
+        )
+        return message, used
+
+    def next_message(self, final: bool = False) -> Message:
+        """Return the next complete Message in the buffer, or None.
+
+        Args:
+            final (bool): No more data will arrive (connection closed or timed
+                out), so accept a last frame that is missing its trailing #.
+        """
+        while True:
+            padding = 0
+            while padding < len(self.buffer) and self.buffer[padding] == 0:
+                padding += 1
+            del self.buffer[:padding]
+            if not self.buffer:
+                return None
+            if not self.buffer.startswith(FRAME_MARKER):
+                if len(self.buffer) < len(FRAME_MARKER) and FRAME_MARKER.startswith(
+                    self.buffer
+                ):
+                    return None
+                self._resync(0)
+                continue
+            try:
+                decoded = self._decode(final)
+            except ValueError:
+                self._resync()
+                continue
+            if decoded is None:
+                return None
+            message, used = decoded
+            del self.buffer[:used]
+            return message
@@ -1,20 +1,26 @@
 import asyncio
 import logging
 from .timeouthelper import TimeoutHelper
-from .message import Message
+from .message import FrameDecoder, Message
 from .message import MessageType
+from .trace import TraceBuffer
 from time import perf_counter
 
 logger = logging.getLogger(__name__)
 TIMEOUT = 5
+READ_SIZE = 4096
 
 
 class MessageClient:
-    def __init__(self, host, port):
+    def __init__(self, host, port, trace_size: int = 0):
         self.host = host
         self.port = port
         self.reader = None
         self.writer = None
+        # Opt-in ring buffer of recent frames, dumped on parse errors and timeouts
+        self.trace = TraceBuffer(trace_size, f"{host}:{port}") if trace_size else None
+        self.decoder = FrameDecoder()
+        self.at_eof = False  # GrowCube closed the connection
 
     async def connect(self):
         try:
@@ -22,129 +28,170 @@ class MessageClient:
             self.reader, self.writer = await asyncio.wait_for(
                 asyncio.open_connection(self.host, self.port), timeout=TIMEOUT
             )
+            if self.trace is not None:
+                self.trace.record("connect")
         except asyncio.TimeoutError:
             logger.exception(
-                f"Connection timed out connecting to: {self.host} {self.port}"
+                "Connection timed out connecting to: %s %s", self.host, self.port
             )
             raise
         except Exception as e:
             logger.exception(
-                f"Connection error: {e}. Connecting to: {self.host} {self.port}"
+                "Connection error: %s. Connecting to: %s %s", e, self.host, self.port
             )
             raise
 
     async def close(self):
+        if self.decoder.skipped_bytes:
+            logger.info(
+                "Skipped %s corrupt bytes in %s resyncs from %s",
+                self.decoder.skipped_bytes,
+                self.decoder.resyncs,
+                self.host,
+            )
         if self.writer:
             self.writer.close()
             await asyncio.wait_for(self.writer.wait_closed(), timeout=TIMEOUT)
 
-    async def send_message(
-        self, message: Message, timeout: TimeoutHelper = TimeoutHelper(TIMEOUT)
-    ):
+    async def send_message(self, message: Message, timeout: TimeoutHelper = None):
         if not self.writer:
             raise ValueError(
                 "Socket connection is not established. Call connect() first."
             )
+        # A default argument would be created (and start timing) at import
+        timeout = timeout or TimeoutHelper(TIMEOUT)
         try:
-            message_string = message.get_message()
-            logger.info(
-                f"SENDING {message.readable_message_type}: {message.message_content}. {message_string}"
-            )
-            self.writer.write(message_string.encode())
+            data = message.encode()
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "SENDING %s: %s. %s",
+                    message.readable_message_type,
+                    message.message_content,
+                    data,
+                )
+            if self.trace is not None:
+                self.trace.record("tx", data)
+            self.writer.write(data)
             await asyncio.wait_for(self.writer.drain(), timeout=timeout.remaining)
         except asyncio.TimeoutError:
             logger.exception("Network operation timed out.")
             raise
         except Exception as e:
-            logger.exception(f"Error sending message: {e}")
+            logger.exception("Error sending message: %s", e)
             raise
 
-    async def read_until_delimiter(
-        self, timeout: TimeoutHelper = TimeoutHelper(TIMEOUT), delimiter=b"#"
-    ) -> str:
-        """Read a field from growcube until we get to a delimiter character.
-        We have to do this a character at a time to strip the zeros sent in between messages.
-        """
-        data = b""
+    async def send_messages(self, messages, timeout: TimeoutHelper = None):
+        """Send several messages with a single write and drain."""
+        if not self.writer:
+            raise ValueError(
+                "Socket connection is not established. Call connect() first."
+            )
+        timeout = timeout or TimeoutHelper(TIMEOUT)
         try:
-            while True:
-                if timeout.timed_out:
-                    logger.warn(
-                        "Timed out waiting for data. Timeout=%s, elapsed=%s. Received: %s",
-                        timeout.timeout,
-                        timeout.elapsed,
-                        data.decode(),
-                    )
-                    raise asyncio.TimeoutError()
-                chunk = await asyncio.wait_for(
-                    self.reader.read(1), timeout=timeout.remaining
-                )
-                if chunk == delimiter:
-                    break
-                if chunk != (b"\x00"):
-                    data += chunk
-                if len(data) == 6:
-                    # GrowCube sends ele5XX responses without a trailing #
-                    s = data[:4].decode()
-                    if s == "ele5":
-                        break
+            frames = [message.encode() for message in messages]
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("SENDING %s messages: %s", len(frames), b"".join(frames))
+            if self.trace is not None:
+                for frame in frames:
+                    self.trace.record("tx", frame)
+            self.writer.writelines(frames)
+            await asyncio.wait_for(self.writer.drain(), timeout=timeout.remaining)
         except asyncio.TimeoutError:
-            logger.warn(
-                "Timed out waiting for data. Timeout=%s, elapsed=%s. Received: %s",
-                timeout.timeout,
-                timeout.elapsed,
-                data.decode(),
-            )
+            logger.exception("Network operation timed out.")
             raise
         except Exception as e:
-            logger.exception(f"Error reading data {e}")
+            logger.exception("Error sending messages: %s", e)
             raise
-        return data.decode()
 
-    async def receive_message(
-        self, timeout: TimeoutHelper = TimeoutHelper(TIMEOUT)
-    ) -> Message:
+    @property
+    def skipped_bytes(self) -> int:
+        """Bytes discarded so far while resynchronising after corrupt data."""
+        return self.decoder.skipped_bytes
+
+    def _next_message(self, final: bool = False) -> Message:
+        resyncs = self.decoder.resyncs
+        skipped = self.decoder.skipped_bytes
+        message = self.decoder.next_message(final)
+        if self.decoder.resyncs != resyncs:
+            logger.warning(
+                "Skipped %s bytes from %s to resynchronise with the next message: %r",
+                self.decoder.skipped_bytes - skipped,
+                self.host,
+                self.decoder.last_skipped,
+            )
+            if self.trace is not None:
+                self.trace.record("skip", self.decoder.last_skipped)
+                self.trace.dump("resynchronised after corrupt data")
+        if message is not None and logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "RECEIVED %s: %s",
+                message.readable_message_type,
+                message.message_content,
+            )
+        return message
+
+    async def receive_message(self, timeout: TimeoutHelper = None) -> Message:
+        """Return the next message from GrowCube, or None if none arrived in time.
+
+        Data is read in blocks into a FrameDecoder, which skips over corrupt
+        frames to the next one.
+
+        Raises:
+            ConnectionError: GrowCube closed the connection and every message
+                it sent has been returned.
+        """
         if not self.reader:
             raise ValueError(
                 "Socket connection is not established. Call connect() first."
             )
+        timeout = timeout or TimeoutHelper(TIMEOUT)
         try:
-            # Receive message type and content length values
-            message_type_string = await self.read_until_delimiter(timeout)
-            if not message_type_string.startswith("ele"):
-                raise ValueError(
-                    f"Did not recognise a GrowCube message type - does not begin with 'ele': {message_type}"
+            while True:
+                message = self._next_message(final=self.at_eof)
+                if message is not None:
+                    return message
+                if self.at_eof:
+                    raise ConnectionError(f"Connection closed by {self.host}")
+                if timeout.timed_out:
+                    raise asyncio.TimeoutError()
+                data = await asyncio.wait_for(
+                    self.reader.read(READ_SIZE), timeout=timeout.remaining
                 )
-            if message_type_string[3] == "a":
-                message_type = int(message_type_string[4:])
-            else:
-                message_type = int(message_type_string[3:])
-            message = Message(message_type=message_type)
-            if not message.content_expected_for_message_type:
+                if not data:
+                    self.at_eof = True
+                    logger.warning(
+                        "Connection closed by %s. Unparsed data: %r",
+                        self.host,
+                        bytes(self.decoder.buffer),
+                    )
+                    if self.trace is not None:
+                        self.trace.record("eof")
+                    continue
+                if self.trace is not None:
+                    self.trace.record("rx", data)
+                self.decoder.feed(data)
+        except asyncio.TimeoutError:
+            # A last frame may be complete apart from its trailing #
+            message = self._next_message(final=True)
+            if message is not None:
                 return message
-
-            length = await self.read_until_delimiter(timeout)
-            if not length.isdigit():
-                raise ValueError(
-                    f"Did not receive an integer content length as expected: {length}"
-                )
-
-            # Receive the message content based on the content length
-            message_content_response = (await asyncio.wait_for(
-                self.reader.read(int(length) + 1), timeout=timeout.remaining
-            )).decode()
-            message_content = message_content_response[:-1]
-            end = message_content_response[-1]
-            if not end == "#":
-                logger.warn(
-                    "Unexpected content at end of message. Expecting #, got " + end
-                )
-            message.content_length = length
-            message.message_content = message_content
-            logger.info(f"RECEIVED {message.readable_message_type}: {message_content}")
-            return message
+            logger.warning(
+                "Timed out waiting for data. Timeout=%s, elapsed=%s. Received: %s",
+                timeout.timeout,
+                timeout.elapsed,
+                bytes(self.decoder.buffer),
+            )
+            if self.trace is not None:
+                self.trace.record("timeout", bytes(self.decoder.buffer))
+                self.trace.dump("timed out waiting for data")
+            return None
+        except ConnectionError:
+            raise
         except Exception as e:
-            logger.error(f"Error receiving message: {e}")
+            logger.error("Error receiving message: %s", e)
+            if self.trace is not None:
+                self.trace.record("error", str(e))
+                self.trace.dump(f"error receiving message: {e}")
             return None
 
 
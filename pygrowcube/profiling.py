@@ -0,0 +1,205 @@
+"""Opt-in profiling of GrowCube sessions.
+
+profile_session() wraps any code (e.g. a get_status call or a fleet run) and
+writes its results to files:
+
+- <prefix>.prof: cProfile stats, readable with pstats or snakeviz
+- <prefix>.alloc.txt: top tracemalloc allocations by line (trace_malloc=True)
+- <prefix>.tasks.txt: wall time and time spent running vs awaiting for each
+  coroutine run as an asyncio task while the session was active
+
+For example::
+
+    with profile_session("poll", trace_malloc=True):
+        status = asyncio.run(get_status("192.168.1.20"))
+"""
+import asyncio
+import collections.abc
+import cProfile
+import logging
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+TOP_ALLOCATIONS = 25
+TOP_FUNCTIONS = 40
+
+
+class TaskTimings:
+    """Accumulated timings per coroutine name."""
+
+    def __init__(self):
+        self.timings = {}  # name -> [count, wall, running]
+
+    def add(self, name: str, wall: float, running: float):
+        timing = self.timings.setdefault(name, [0, 0.0, 0.0])
+        timing[0] += 1
+        timing[1] += wall
+        timing[2] += running
+
+    def format(self) -> str:
+        lines = [
+            f"{'coroutine':<60} {'count':>6} {'wall s':>10} "
+            f"{'running s':>10} {'awaiting s':>10}"
+        ]
+        for name, (count, wall, running) in sorted(
+            self.timings.items(), key=lambda item: -item[1][1]
+        ):
+            lines.append(
+                f"{name:<60} {count:>6} {wall:>10.4f} "
+                f"{running:>10.4f} {wall - running:>10.4f}"
+            )
+        return "\n".join(lines)
+
+
+class _TimedCoroutine(collections.abc.Coroutine):
+    """Wrap a coroutine, timing each step the event loop runs it for.
+
+    Time between steps is time spent awaiting (network I/O, sleeps, other tasks).
+    """
+
+    def __init__(self, coro, timings: TaskTimings):
+        self._coro = coro
+        self._timings = timings
+        self._name = getattr(coro, "__qualname__", type(coro).__name__)
+        self._started = None
+        self._running = 0.0
+
+    def _step(self, method, *args):
+        start = perf_counter()
+        if self._started is None:
+            self._started = start
+        try:
+            result = method(*args)
+        except BaseException:
+            # StopIteration when the coroutine returns, or the error it raised
+            end = perf_counter()
+            self._running += end - start
+            self._timings.add(self._name, end - self._started, self._running)
+            raise
+        self._running += perf_counter() - start
+        return result
+
+    def send(self, value):
+        return self._step(self._coro.send, value)
+
+    def throw(self, *args):
+        return self._step(self._coro.throw, *args)
+
+    def close(self):
+        return self._coro.close()
+
+    def __await__(self):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.send(None)
+
+
+def _timing_task_factory(timings: TaskTimings, previous):
+    def factory(loop, coro, **kwargs):
+        wrapped = _TimedCoroutine(coro, timings)
+        if previous is not None:
+            return previous(loop, wrapped, **kwargs)
+        return asyncio.Task(wrapped, loop=loop, **kwargs)
+
+    return factory
+
+
+class ProfileSession:
+    """Results of a profile_session, also available after the files are written."""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.profiler = None
+        self.snapshot = None
+        self.task_timings = TaskTimings()
+        self.files = []
+        self._loops = []
+
+    def instrument_loop(self, loop: asyncio.AbstractEventLoop = None):
+        """Time the coroutines of tasks created on loop (default: the running loop).
+
+        profile_session calls this for loops created by asyncio.run while it is active.
+        """
+        loop = loop or asyncio.get_event_loop()
+        previous = loop.get_task_factory()
+        loop.set_task_factory(_timing_task_factory(self.task_timings, previous))
+        self._loops.append((loop, previous))
+
+    def write(self):
+        if self.profiler is not None:
+            path = self.prefix + ".prof"
+            self.profiler.dump_stats(path)
+            self.files.append(path)
+            with open(self.prefix + ".prof.txt", "w") as f:
+                stats = pstats.Stats(self.profiler, stream=f)
+                stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+            self.files.append(self.prefix + ".prof.txt")
+        if self.snapshot is not None:
+            path = self.prefix + ".alloc.txt"
+            with open(path, "w") as f:
+                for stat in self.snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+                    f.write(f"{stat}\n")
+            self.files.append(path)
+        if self.task_timings.timings:
+            path = self.prefix + ".tasks.txt"
+            with open(path, "w") as f:
+                f.write(self.task_timings.format() + "\n")
+            self.files.append(path)
+        logger.info("Profile written to %s", ", ".join(self.files))
+
+
+@contextmanager
+def profile_session(
+    prefix: str = "pygrowcube",
+    cprofile: bool = True,
+    trace_malloc: bool = False,
+    task_timing: bool = True,
+):
+    """Profile the enclosed code and write the results to files named from prefix.
+
+    Args:
+        prefix (str): Path prefix for the output files.
+        cprofile (bool): Collect cProfile stats.
+        trace_malloc (bool): Collect the top allocations with tracemalloc.
+        task_timing (bool): Time the coroutines of asyncio tasks, including
+            those run by asyncio.run inside the session.
+    """
+    session = ProfileSession(prefix)
+    policy = asyncio.get_event_loop_policy()
+    new_event_loop = None
+    if task_timing:
+        new_event_loop = policy.new_event_loop
+
+        def instrumented_new_event_loop():
+            loop = new_event_loop()
+            session.instrument_loop(loop)
+            return loop
+
+        policy.new_event_loop = instrumented_new_event_loop
+    if trace_malloc:
+        tracemalloc.start()
+    if cprofile:
+        session.profiler = cProfile.Profile()
+        session.profiler.enable()
+    try:
+        yield session
+    finally:
+        if session.profiler is not None:
+            session.profiler.disable()
+        if trace_malloc:
+            session.snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+        if new_event_loop is not None:
+            del policy.new_event_loop
+        for loop, previous in session._loops:
+            if not loop.is_closed():
+                loop.set_task_factory(previous)
+        session.write()
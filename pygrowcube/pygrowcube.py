@@ -3,24 +3,97 @@ from .message import Message
 from .message import MessageType
 from .messageclient import MessageClient
 from .timeouthelper import TimeoutHelper
+from collections import namedtuple
+from datetime import date, datetime
+from time import time
+import asyncio
 import logging
 
 PORT = 8800
 STATUS_TIMEOUT = (
     15  # wait max 15 seconds - sensors send a refresh every 10s when connected
 )
+HISTORY_TIMEOUT = 60  # overall deadline for fetching history for all channels
+HISTORY_IDLE_TIMEOUT = 3  # history is complete once no entries arrive for 3s
 
 logger = logging.getLogger(__name__)
 
+# Reading.flags bits
+FLAG_SENSOR_DISCONNECTED = 1
+FLAG_OUTLET_LOCKED = 2
+FLAG_NO_WATER = 4
+
+# A single channel's values from one refresh cycle. timestamp is seconds since the epoch.
+Reading = namedtuple(
+    "Reading",
+    ["device", "timestamp", "channel", "moisture", "humidity", "temperature", "flags"],
+)
+
+# Hourly moisture for one channel and date from a SENSOR_HISTORY_ENTRY. Hours
+# without a reading are 0.
+SensorHistory = namedtuple("SensorHistory", ["channel", "date", "moistures"])
+# A watering event from a WATERING_HISTORY_ENTRY
+WateringEvent = namedtuple("WateringEvent", ["channel", "time"])
+
+
+def parse_sensor_history(message: Message) -> SensorHistory:
+    """Parse the content of a SENSOR_HISTORY_ENTRY, e.g. 0@2023@8@28@00,00,...,83"""
+    fields = message.get_fields()
+    if len(fields) != 5:
+        raise ValueError(
+            f"{message.readable_message_type}: Expecting 5 fields. Message: {message.get_message()}"
+        )
+    channel, year, month, day, hourly = fields
+    moistures = [int(value) for value in hourly.split(",")]
+    if len(moistures) != 24:
+        raise ValueError(
+            f"{message.readable_message_type}: Expecting 24 hourly values. Message: {message.get_message()}"
+        )
+    return SensorHistory(int(channel), date(int(year), int(month), int(day)), moistures)
+
+
+def parse_watering_event(message: Message) -> WateringEvent:
+    """Parse the content of a WATERING_HISTORY_ENTRY, e.g. 0@2023@8@28@11@49"""
+    fields = message.get_fields()
+    if len(fields) != 6:
+        raise ValueError(
+            f"{message.readable_message_type}: Expecting 6 fields. Message: {message.get_message()}"
+        )
+    channel, year, month, day, hour, minute = (int(field) for field in fields)
+    return WateringEvent(channel, datetime(year, month, day, hour, minute))
+
+
+class ChannelHistory:
+    """Default get_history sink collecting the entries for one channel."""
+
+    def __init__(self, channel: int):
+        self.channel = channel
+        self.moistures = []  # SensorHistory entries
+        self.waterings = []  # WateringEvent entries
+
+    def __call__(self, entry):
+        if isinstance(entry, SensorHistory):
+            self.moistures.append(entry)
+        else:
+            self.waterings.append(entry)
+
+    def __str__(self) -> str:
+        s = f"Channel {self.channel}\n"
+        for entry in self.moistures:
+            s += f" - {entry.date.isoformat()}: {','.join(map(str, entry.moistures))}\n"
+        for event in self.waterings:
+            s += f" - Watered {event.time.isoformat(sep=' ')}\n"
+        return s.rstrip()
+
 
 class Status:
     def __init__(
         self,
         temperature=0,
         humidity=0,
-        moistures=[0, 0, 0, 0],
-        sensor_warnings=[0, 0, 0, 0],
-        outlet_locks=[0, 0, 0, 0],
+        moistures=None,
+        sensor_warnings=None,
+        outlet_locks=None,
         version="",
         id="",
         host="",
@@ -29,9 +102,13 @@ class Status:
     ):
         self.temperature = temperature
         self.humidity = humidity
-        self.moistures = moistures
-        self.sensor_warnings = sensor_warnings
-        self.outlet_locks = outlet_locks
+        # Don't share default lists between instances - several Status objects
+        # can be alive at once (e.g. in the exporter cache)
+        self.moistures = moistures if moistures is not None else [0, 0, 0, 0]
+        self.sensor_warnings = (
+            sensor_warnings if sensor_warnings is not None else [0, 0, 0, 0]
+        )
+        self.outlet_locks = outlet_locks if outlet_locks is not None else [0, 0, 0, 0]
         self.version = version
         self.refreshed_sensors = [False, False, False, False]
         self.id = id
@@ -65,6 +142,31 @@ class Status:
     def is_refresh_complete(self):
         return all(self.refreshed_sensors)
 
+    def channel_flags(self, channel: int) -> int:
+        flags = FLAG_NO_WATER if not self.has_water else 0
+        if self.sensor_warnings[channel]:
+            flags |= FLAG_SENSOR_DISCONNECTED
+        if self.outlet_locks[channel]:
+            flags |= FLAG_OUTLET_LOCKED
+        return flags
+
+    def readings(self, timestamp: float = None) -> list:
+        """Return a Reading for each channel refreshed in the last cycle."""
+        timestamp = time() if timestamp is None else timestamp
+        return [
+            Reading(
+                self.id or self.host,
+                timestamp,
+                channel,
+                self.moistures[channel],
+                self.humidity,
+                self.temperature,
+                self.channel_flags(channel),
+            )
+            for channel in range(4)
+            if self.refreshed_sensors[channel]
+        ]
+
     def handle_sensor_disconnected(self, message: Message):
         if not message.message_content.isdigit():
             raise ValueError(
@@ -108,7 +210,7 @@ class Status:
         self.temperature = int(temperature)
         self.moistures[channel] = int(reading)
         self.refreshed_sensors[channel] = True
-        logger.debug(f"Received reading for sensor {channel}: {reading}.")
+        logger.debug("Received reading for sensor %s: %s.", channel, reading)
 
     def handle_start_reading(self, message: Message):
         self.refreshed_sensors = [False, False, False, False]
@@ -150,9 +252,10 @@ class Status:
     }
 
     def handle_message(self, message: Message):
-        logger.debug(
-            f"RECEIVED {message.readable_message_type}: {message.get_message()}"
-        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "RECEIVED %s: %s", message.readable_message_type, message.get_message()
+            )
         if message.message_type in self.status_handlers:
             handler = self.status_handlers.get(message.message_type)
             handler(self, message)
@@ -165,11 +268,19 @@ async def get_status(
     timeout_in_seconds: float = STATUS_TIMEOUT,
     wait_for_sensor_readings: bool = True,
     get_history: bool = False,
+    message_callback=None,
+    trace_size: int = 0,
 ) -> Status:
+    """Connect to a GrowCube and return its Status.
+
+    message_callback, if given, is called with every Message received, e.g. so
+    a scheduler can note when the GrowCube starts sending readings.
+    trace_size > 0 keeps that many recent frames to log if a read fails.
+    """
     logger.info(
         f"Getting status of GrowCube at {growcube_address}:{PORT}. Timeout {timeout_in_seconds}. Wait for readings: {wait_for_sensor_readings}."
     )
-    client = MessageClient(growcube_address, PORT)
+    client = MessageClient(growcube_address, PORT, trace_size)
     status = Status(host=growcube_address, connect_only=not wait_for_sensor_readings)
     timeout = TimeoutHelper(timeout_in_seconds)
     try:
@@ -186,15 +297,23 @@ async def get_status(
             )
         else:
             status.handle_message(response)
+            if message_callback:
+                message_callback(response)
             if wait_for_sensor_readings:
                 request = Message(
                     message_type=MessageType.REQUEST_READINGS, message_content="2"
                 )
                 await client.send_message(request, timeout)
                 while not status.is_refresh_complete:
-                    response = await client.receive_message(timeout)
+                    try:
+                        response = await client.receive_message(timeout)
+                    except ConnectionError as e:
+                        logger.warning("Incomplete refresh of sensors: %s", e)
+                        break
                     if isinstance(response, Message):
                         status.handle_message(response)
+                        if message_callback:
+                            message_callback(response)
                     else:
                         logger.warn(
                             f"Response is not a recognisable message: {str(response)}"
@@ -206,8 +325,181 @@ async def get_status(
                         break
                     else:
                         logger.debug(
-                            f"Looping. Elapsed:{timeout.elapsed}, Timeout: {timeout_in_seconds}"
+                            "Looping. Elapsed:%s, Timeout: %s",
+                            timeout.elapsed,
+                            timeout_in_seconds,
                         )
             return status
     finally:
         await client.close()
+
+
+async def watch_status(
+    growcube_address: str,
+    timeout_in_seconds: float = STATUS_TIMEOUT,
+    trace_size: int = 0,
+):
+    """Keep a connection open and yield the Status after every refresh cycle.
+
+    GrowCube pushes a full set of sensor readings every 10s while a client is
+    connected. The same Status object is updated and yielded after each set.
+    Raises asyncio.TimeoutError if a cycle doesn't complete within the timeout
+    and ConnectionError if GrowCube closes the connection.
+    """
+    logger.info("Watching GrowCube at %s:%s", growcube_address, PORT)
+    client = MessageClient(growcube_address, PORT, trace_size)
+    status = Status(host=growcube_address)
+    timeout = TimeoutHelper(timeout_in_seconds)
+    try:
+        await client.connect()
+        request = Message(
+            message_type=MessageType.REQUEST_HELLO,
+            message_content=Message.format_datetime_for_growcube(),
+        )
+        readings_request = Message(
+            message_type=MessageType.REQUEST_READINGS, message_content="2"
+        )
+        await client.send_messages([request, readings_request], timeout)
+        # GrowCube only sends START_READINGS at the start of a session so track
+        # the channels seen to spot the end of each cycle
+        channels_seen = set()
+        while True:
+            response = await client.receive_message(timeout)
+            if isinstance(response, Message):
+                status.handle_message(response)
+                if response.message_type == MessageType.SENSOR_READING:
+                    channels_seen.add(response.get_fields()[0])
+                    if len(channels_seen) == 4:
+                        yield status
+                        channels_seen.clear()
+                        timeout = TimeoutHelper(timeout_in_seconds)
+            if timeout.timed_out:
+                raise asyncio.TimeoutError(
+                    f"No complete refresh from {growcube_address} within {timeout_in_seconds}s"
+                )
+    finally:
+        await client.close()
+
+
+async def watch_readings(
+    growcube_address: str, timeout_in_seconds: float = STATUS_TIMEOUT
+):
+    """Yield a Reading for each channel every refresh cycle. See watch_status."""
+    async for status in watch_status(growcube_address, timeout_in_seconds):
+        for reading in status.readings():
+            yield reading
+
+
+async def get_history(
+    growcube_address: str,
+    channels=(0, 1, 2, 3),
+    sinks: dict = None,
+    timeout_in_seconds: float = HISTORY_TIMEOUT,
+    idle_timeout: float = HISTORY_IDLE_TIMEOUT,
+    trace_size: int = 0,
+) -> dict:
+    """Fetch moisture and watering history for several channels over one connection.
+
+    A REQUEST_SENSOR_HISTORY is sent for every channel up front and the
+    interleaved SENSOR_HISTORY_ENTRY and WATERING_HISTORY_ENTRY responses are
+    passed to the sink for the channel in their first field.
+
+    Args:
+        channels: Channels to fetch.
+        sinks (dict): channel -> callable taking a SensorHistory or
+            WateringEvent. Defaults to a ChannelHistory per channel.
+        timeout_in_seconds (float): Deadline for the whole fetch.
+        idle_timeout (float): The fetch ends once no history entry has arrived
+            for this long, counted from the first frame the GrowCube sends.
+        trace_size (int): Recent frames to keep and log if a read fails.
+    Returns:
+        dict: The sinks, keyed by channel.
+    """
+    channels = list(channels)
+    if sinks is None:
+        sinks = {channel: ChannelHistory(channel) for channel in channels}
+    logger.info(
+        "Getting history for channels %s of GrowCube at %s:%s",
+        channels,
+        growcube_address,
+        PORT,
+    )
+    parsers = {
+        MessageType.SENSOR_HISTORY_ENTRY: parse_sensor_history,
+        MessageType.WATERING_HISTORY_ENTRY: parse_watering_event,
+    }
+    client = MessageClient(growcube_address, PORT, trace_size)
+    deadline = TimeoutHelper(timeout_in_seconds)
+    try:
+        await client.connect()
+        request = Message(
+            message_type=MessageType.REQUEST_HELLO,
+            message_content=Message.format_datetime_for_growcube(),
+        )
+        requests = [request] + [
+            Message(
+                message_type=MessageType.REQUEST_SENSOR_HISTORY,
+                message_content=str(channel),
+            )
+            for channel in channels
+        ]
+        await client.send_messages(requests, deadline)
+
+        entries = 0
+        invalid = 0
+        idle = None  # started by the first frame, reset by each history entry
+        while not deadline.timed_out:
+            remaining = deadline.remaining
+            if idle is not None:
+                if idle.timed_out:
+                    break
+                remaining = min(remaining, idle.remaining)
+            try:
+                response = await client.receive_message(TimeoutHelper(remaining))
+            except ConnectionError as e:
+                logger.warning("History fetch ended early: %s", e)
+                break
+            if not isinstance(response, Message):
+                continue
+            if idle is None:
+                idle = TimeoutHelper(idle_timeout)
+            parser = parsers.get(response.message_type)
+            if parser is None:
+                logger.debug(
+                    "Ignoring %s during history fetch", response.readable_message_type
+                )
+                continue
+            try:
+                entry = parser(response)
+            except ValueError as e:
+                invalid += 1
+                logger.warning(
+                    "Skipping invalid %s %r: %s",
+                    response.readable_message_type,
+                    response.message_content,
+                    e,
+                )
+                continue
+            sink = sinks.get(entry.channel)
+            if sink is None:
+                logger.warning(
+                    "Received history for channel %s which was not requested",
+                    entry.channel,
+                )
+                continue
+            sink(entry)
+            entries += 1
+            idle = TimeoutHelper(idle_timeout)
+        if deadline.timed_out:
+            logger.warning(
+                "History fetch did not finish within %ss. Received %s entries",
+                timeout_in_seconds,
+                entries,
+            )
+        if invalid:
+            logger.warning(
+                "Skipped %s invalid history entries from %s", invalid, growcube_address
+            )
+        return sinks
+    finally:
+        await client.close()
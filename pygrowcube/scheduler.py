@@ -0,0 +1,182 @@
+"""Poll scheduling aligned to each GrowCube's reading cycle.
+
+A GrowCube pushes readings roughly every 10s, each on its own phase, so a poll
+started at an arbitrary time waits on average half a cycle for the next set of
+readings. PhaseEstimator learns a device's phase (and any drift in its period)
+from the times the first SENSOR_READING of each cycle arrives, and
+PollScheduler uses it to connect just before the next cycle while keeping
+connections to the fleet spread out so access points aren't hit by many
+connections at once.
+
+START_READINGS is no use for this: GrowCube sends it once per session, a few
+seconds after the client connects, so it only reflects our own connect times.
+"""
+import logging
+import zlib
+from math import ceil
+from time import time
+
+from .message import MessageType
+
+logger = logging.getLogger(__name__)
+
+CYCLE_PERIOD = 10.0  # GrowCube pushes readings every ~10s
+LEAD_TIME = 1.0  # connect this long before the cycle is expected to start
+MIN_SPACING = 0.25  # minimum seconds between connections sharing an access point
+PHASE_GAIN = 0.3  # weight given to each new observation of the phase
+PERIOD_GAIN = 0.1  # weight given to each new estimate of the period
+MAX_PERIOD_ERROR = 0.05  # ignore period estimates more than 5% from nominal
+
+
+class PhaseEstimator:
+    """Estimate when a GrowCube will next start a reading cycle.
+
+    Args:
+        period (float): Nominal seconds between reading cycles.
+    """
+
+    def __init__(self, period: float = CYCLE_PERIOD):
+        self.nominal_period = period
+        self.period = period
+        self.anchor = None  # estimated start time of a cycle
+        self.jitter = 0.0  # smoothed absolute prediction error in seconds
+        self.observations = 0
+
+    @property
+    def is_known(self) -> bool:
+        return self.anchor is not None
+
+    def _wrap(self, error: float) -> float:
+        """Wrap a phase error into [-period/2, period/2)."""
+        half = self.period / 2
+        return (error + half) % self.period - half
+
+    def observe(self, timestamp: float):
+        """Record the time the first reading of a cycle arrived."""
+        self.observations += 1
+        if self.anchor is None:
+            self.anchor = timestamp
+            return
+
+        elapsed = timestamp - self.anchor
+        cycles = round(elapsed / self.period)
+        # Correct drift in the period using the whole span since the anchor,
+        # which is far more precise than a single cycle
+        if cycles > 0:
+            period = elapsed / cycles
+            if abs(period - self.nominal_period) <= (
+                self.nominal_period * MAX_PERIOD_ERROR
+            ):
+                self.period += PERIOD_GAIN * (period - self.period)
+        error = self._wrap(elapsed - cycles * self.period)
+        self.jitter += PHASE_GAIN * (abs(error) - self.jitter)
+        self.anchor = timestamp - (1 - PHASE_GAIN) * error
+
+    def next_cycle(self, after: float) -> float:
+        """Return the expected start of the first cycle at or after the given time."""
+        if self.anchor is None:
+            raise ValueError("Phase not known yet - no readings observed")
+        cycles = ceil((after - self.anchor) / self.period)
+        return self.anchor + cycles * self.period
+
+
+class PollScheduler:
+    """Choose connection times for a fleet of GrowCubes.
+
+    Args:
+        period (float): Nominal seconds between reading cycles.
+        lead (float): Seconds before the expected cycle start to connect.
+        min_spacing (float): Minimum seconds between connections to devices on
+            the same access point.
+        access_points (dict): Optional host -> access point name. Hosts not in
+            the dict share a single default access point.
+    """
+
+    def __init__(
+        self,
+        period: float = CYCLE_PERIOD,
+        lead: float = LEAD_TIME,
+        min_spacing: float = MIN_SPACING,
+        access_points: dict = None,
+    ):
+        self.period = period
+        self.lead = lead
+        self.min_spacing = min_spacing
+        self.access_points = access_points or {}
+        self.estimators = {}
+        self._reserved = {}  # access point -> {host: connect time}
+        self._last_reading = {}  # host -> time the latest reading arrived
+
+    def estimator(self, host: str) -> PhaseEstimator:
+        estimator = self.estimators.get(host)
+        if estimator is None:
+            estimator = self.estimators[host] = PhaseEstimator(self.period)
+        return estimator
+
+    def observe(self, host: str, timestamp: float = None):
+        """Record that host started a reading cycle at timestamp (default now)."""
+        self.estimator(host).observe(time() if timestamp is None else timestamp)
+
+    def observe_reading(self, host: str, timestamp: float = None):
+        """Record that host sent a SENSOR_READING at timestamp (default now).
+
+        The readings of a cycle arrive together, so a reading counts as the
+        start of a cycle when none arrived in the previous half period.
+        """
+        timestamp = time() if timestamp is None else timestamp
+        last = self._last_reading.get(host)
+        self._last_reading[host] = timestamp
+        if last is None or timestamp - last > self.estimator(host).period / 2:
+            self.observe(host, timestamp)
+
+    def message_callback(self, host: str):
+        """Return a get_status message_callback that feeds this scheduler."""
+
+        def callback(message):
+            if message.message_type == MessageType.SENSOR_READING:
+                self.observe_reading(host)
+
+        return callback
+
+    def _ideal_time(self, host: str, earliest: float) -> float:
+        estimator = self.estimator(host)
+        if estimator.is_known:
+            lead = self.lead + estimator.jitter
+            return estimator.next_cycle(earliest + lead) - lead
+        # Unknown phase: spread hosts evenly over a cycle by a stable hash
+        offset = (zlib.crc32(host.encode()) % 1000) / 1000 * self.period
+        return earliest + offset
+
+    def _is_free(self, access_point: str, host: str, when: float) -> bool:
+        reserved = self._reserved.get(access_point, {})
+        return all(
+            abs(when - other_time) >= self.min_spacing
+            for other, other_time in reserved.items()
+            if other != host
+        )
+
+    def schedule(self, host: str, earliest: float = None) -> float:
+        """Reserve and return the time to next connect to host, no sooner than earliest."""
+        earliest = time() if earliest is None else earliest
+        access_point = self.access_points.get(host, "")
+        ideal = self._ideal_time(host, earliest)
+        candidate = ideal
+        # Connecting a little earlier only costs a little waiting, so look for a
+        # free slot up to half a cycle before the ideal time, then in later cycles
+        steps = max(1, int(self.period / 2 / max(self.min_spacing, 1e-3)))
+        for cycle in range(4):
+            base = ideal + cycle * self.estimator(host).period
+            for step in range(steps):
+                candidate = base - step * self.min_spacing
+                if candidate >= earliest and self._is_free(
+                    access_point, host, candidate
+                ):
+                    self._reserved.setdefault(access_point, {})[host] = candidate
+                    return candidate
+        logger.debug("No free connection slot for %s, using %s", host, candidate)
+        self._reserved.setdefault(access_point, {})[host] = candidate
+        return candidate
+
+    def release(self, host: str):
+        """Forget host's reservation once its poll has started."""
+        self._reserved.get(self.access_points.get(host, ""), {}).pop(host, None)
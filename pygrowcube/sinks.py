@@ -0,0 +1,432 @@
+"""Batching output sinks for readings.
+
+A Sink queues records from the event loop and writes them in batches from a
+thread pool, so slow disks, databases or brokers never block the sockets of
+other GrowCubes. The queue is bounded: when a sink falls behind, put() waits,
+which in turn holds up whatever is collecting readings (e.g. a FleetCollector
+handler) instead of buffering without limit. A batch that fails to write is
+retried with exponential backoff, so while a database or broker is down the
+queue fills and put() waits rather than readings being dropped.
+
+Built in sinks: CsvSink and NdjsonSink (files rotated by a strftime pattern),
+SqliteSink and MqttSink (a minimal MQTT 3.1.1 QoS 0 publisher).
+"""
+import abc
+import asyncio
+import csv
+import json
+import logging
+import os
+import socket
+import sqlite3
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from time import monotonic
+
+from .pygrowcube import Reading, Status
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+BATCH_AGE = 5.0  # seconds a record may wait for its batch to fill
+MAX_PENDING = 10000  # records queued before put() applies backpressure
+RETRY_DELAY = 1.0  # seconds before retrying a failed batch, doubled each attempt
+MAX_RETRY_DELAY = 60.0
+CLOSE_ATTEMPTS = 3  # attempts per batch once close() has been called
+
+_executor = None
+
+
+def _default_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(thread_name_prefix="pygrowcube-sink")
+    return _executor
+
+
+class Sink(abc.ABC):
+    """Base class for batching sinks. Subclasses implement write_batch.
+
+    Args:
+        batch_size (int): Write once this many records are queued.
+        batch_age (float): Write a partial batch once its oldest record is this old.
+        max_pending (int): Queue size at which put() starts waiting.
+        executor: concurrent.futures executor to write in. Defaults to a shared
+            thread pool. Batches from one sink are always written one at a time.
+        retry_delay (float): Seconds before the first retry of a failed batch.
+        max_retry_delay (float): Longest wait between retries.
+        max_retries (int): Retries before a batch is dropped. None retries until
+            it is written, or CLOSE_ATTEMPTS times once the sink is closing.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = BATCH_SIZE,
+        batch_age: float = BATCH_AGE,
+        max_pending: int = MAX_PENDING,
+        executor=None,
+        retry_delay: float = RETRY_DELAY,
+        max_retry_delay: float = MAX_RETRY_DELAY,
+        max_retries: int = None,
+    ):
+        self.batch_size = batch_size
+        self.batch_age = batch_age
+        self.max_pending = max_pending
+        self.executor = executor
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_retries = max_retries
+        self.written = 0
+        self.batches = 0
+        self.failures = 0  # failed write attempts
+        self.dropped = 0  # records given up on
+        self._queue = None
+        self._worker = None
+        self._closing = False
+
+    @abc.abstractmethod
+    def write_batch(self, records: list):
+        """Write a list of Readings. Runs in a worker thread."""
+
+    def close_sync(self):
+        """Release files, connections etc. Runs in a worker thread."""
+
+    def _start(self):
+        if self._worker is None:
+            self._queue = asyncio.Queue(self.max_pending)
+            self._worker = asyncio.ensure_future(self._run())
+
+    async def put(self, record: Reading):
+        """Queue a record, waiting if the sink is max_pending records behind."""
+        self._start()
+        await self._queue.put(record)
+
+    async def put_status(self, status: Status):
+        """Queue a Reading for each channel of a Status. Usable as a FleetCollector handler."""
+        for reading in status.readings():
+            await self.put(reading)
+
+    def _give_up(self, attempts: int) -> bool:
+        if self._closing and attempts >= CLOSE_ATTEMPTS:
+            return True
+        return self.max_retries is not None and attempts > self.max_retries
+
+    async def _write(self, batch: list):
+        loop = asyncio.get_running_loop()
+        delay = self.retry_delay
+        attempts = 0
+        while True:
+            try:
+                await loop.run_in_executor(
+                    self.executor or _default_executor(), self.write_batch, batch
+                )
+                self.written += len(batch)
+                self.batches += 1
+                return
+            except Exception as e:
+                attempts += 1
+                self.failures += 1
+                if self._give_up(attempts):
+                    self.dropped += len(batch)
+                    logger.error(
+                        "%s dropped %s records after %s attempts: %s",
+                        self,
+                        len(batch),
+                        attempts,
+                        e,
+                    )
+                    return
+                logger.warning(
+                    "%s failed to write %s records, retrying in %ss: %s",
+                    self,
+                    len(batch),
+                    delay,
+                    e,
+                )
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_retry_delay)
+
+    async def _run(self):
+        batch = []
+        deadline = None
+        closing = False
+        while not closing:
+            timeout = None if deadline is None else max(0.0, deadline - monotonic())
+            try:
+                record = await asyncio.wait_for(self._queue.get(), timeout)
+                if record is None:  # close() sentinel
+                    closing = True
+                else:
+                    batch.append(record)
+                    if deadline is None:
+                        deadline = monotonic() + self.batch_age
+            except asyncio.TimeoutError:
+                pass
+            if batch and (
+                closing or len(batch) >= self.batch_size or monotonic() >= deadline
+            ):
+                await self._write(batch)
+                batch = []
+                deadline = None
+
+    async def close(self):
+        """Write anything queued and release the sink."""
+        self._closing = True
+        if self._worker is not None:
+            await self._queue.put(None)
+            await self._worker
+            self._worker = None
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            self.executor or _default_executor(), self.close_sync
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def __str__(self) -> str:
+        return type(self).__name__
+
+
+def reading_to_dict(reading: Reading) -> dict:
+    record = reading._asdict()
+    record["time"] = datetime.fromtimestamp(
+        reading.timestamp, tz=timezone.utc
+    ).isoformat()
+    return record
+
+
+class _RotatingFileSink(Sink):
+    """Append records to a file named by formatting a strftime pattern with
+    the record's UTC timestamp, e.g. readings-%Y-%m-%d.csv rotates daily.
+
+    Progress through a batch is kept across retries: records already flushed
+    are skipped, and rows of a failed partial write are truncated away, so a
+    retried batch doesn't duplicate rows. Subclasses implement _write_record.
+    """
+
+    def __init__(self, pattern: str, **kwargs):
+        super().__init__(**kwargs)
+        self.pattern = pattern
+        self._path = None
+        self._file = None
+        self._batch = None  # batch being written, to resume it on retry
+        self._flushed = 0  # records of _batch already flushed
+        self._rollback = None  # (path, size) to truncate to before resuming
+
+    def _path_for(self, reading: Reading) -> str:
+        return datetime.fromtimestamp(reading.timestamp, tz=timezone.utc).strftime(
+            self.pattern
+        )
+
+    def _file_for(self, reading: Reading):
+        path = self._path_for(reading)
+        if path != self._path:
+            self.close_sync()
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+            self._file = open(path, "a", newline="")
+            self._path = path
+            self._opened(is_new)
+        return self._file
+
+    def _opened(self, is_new: bool):
+        pass
+
+    @abc.abstractmethod
+    def _write_record(self, file, reading: Reading):
+        """Write one Reading to the open file."""
+
+    def write_batch(self, records: list):
+        if records is not self._batch:
+            self._batch, self._flushed, self._rollback = records, 0, None
+        if self._rollback is not None:
+            path, size = self._rollback
+            with open(path, "r+b") as f:
+                f.truncate(size)
+            self._rollback = None
+        try:
+            while self._flushed < len(records):
+                file = self._file_for(records[self._flushed])
+                path = self._path
+                self._rollback = (path, os.fstat(file.fileno()).st_size)
+                end = self._flushed
+                while end < len(records) and self._path_for(records[end]) == path:
+                    self._write_record(file, records[end])
+                    end += 1
+                file.flush()
+                self._flushed, self._rollback = end, None
+        except Exception:
+            try:
+                # Don't keep half written rows buffered for the next attempt
+                self.close_sync()
+            except OSError:
+                pass
+            raise
+        self._batch = None
+
+    def close_sync(self):
+        if self._file is not None:
+            file, self._file, self._path = self._file, None, None
+            file.close()
+
+    def __str__(self) -> str:
+        return f"{type(self).__name__}({self.pattern})"
+
+
+class CsvSink(_RotatingFileSink):
+    """Write readings as CSV with a header row per file."""
+
+    def _opened(self, is_new: bool):
+        self._writer = csv.writer(self._file)
+        if is_new:
+            self._writer.writerow(("time",) + Reading._fields)
+
+    def _write_record(self, file, reading: Reading):
+        self._writer.writerow((reading_to_dict(reading)["time"],) + tuple(reading))
+
+
+class NdjsonSink(_RotatingFileSink):
+    """Write readings as newline-delimited JSON objects."""
+
+    def _write_record(self, file, reading: Reading):
+        file.write(json.dumps(reading_to_dict(reading)) + "\n")
+
+
+class SqliteSink(Sink):
+    """Insert readings into a SQLite table with one executemany per batch."""
+
+    def __init__(self, path: str, table: str = "readings", **kwargs):
+        super().__init__(**kwargs)
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name: {table}")
+        self.path = path
+        self.table = table
+        self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            # Batches are written one at a time but not always on the same
+            # pool thread
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "device TEXT, timestamp REAL, channel INTEGER, moisture INTEGER, "
+                "humidity INTEGER, temperature INTEGER, flags INTEGER)"
+            )
+        return self._connection
+
+    def write_batch(self, records: list):
+        connection = self._connect()
+        with connection:
+            connection.executemany(
+                f"INSERT INTO {self.table} VALUES (?, ?, ?, ?, ?, ?, ?)", records
+            )
+
+    def close_sync(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __str__(self) -> str:
+        return f"SqliteSink({self.path})"
+
+
+def _mqtt_string(value: str) -> bytes:
+    data = value.encode()
+    return struct.pack("!H", len(data)) + data
+
+
+def _mqtt_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(encoded)
+
+
+def mqtt_connect_packet(client_id: str, keepalive: int = 60) -> bytes:
+    variable = _mqtt_string("MQTT") + bytes([4, 0x02]) + struct.pack("!H", keepalive)
+    payload = _mqtt_string(client_id)
+    return b"\x10" + _mqtt_length(len(variable) + len(payload)) + variable + payload
+
+
+def mqtt_publish_packet(topic: str, payload: bytes, retain: bool = False) -> bytes:
+    body = _mqtt_string(topic) + payload
+    return bytes([0x30 | int(retain)]) + _mqtt_length(len(body)) + body
+
+
+class MqttSink(Sink):
+    """Publish each reading as JSON to an MQTT broker (QoS 0).
+
+    Args:
+        host (str): Broker address.
+        port (int): Broker port.
+        topic (str): Topic format, filled from the Reading's fields.
+        retain (bool): Set the retain flag so new subscribers get the latest value.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int = 1883,
+        topic: str = "growcube/{device}/{channel}",
+        client_id: str = "pygrowcube",
+        retain: bool = False,
+        timeout: float = 10,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.host = host
+        self.port = port
+        self.topic = topic
+        self.client_id = client_id
+        self.retain = retain
+        self.timeout = timeout
+        self._socket = None
+
+    def _connect(self):
+        if self._socket is None:
+            sock = socket.create_connection((self.host, self.port), self.timeout)
+            sock.sendall(mqtt_connect_packet(self.client_id))
+            connack = sock.recv(4)
+            if len(connack) < 4 or connack[0] != 0x20 or connack[3] != 0:
+                sock.close()
+                raise ConnectionError(f"MQTT broker refused connection: {connack!r}")
+            self._socket = sock
+        return self._socket
+
+    def write_batch(self, records: list):
+        data = b"".join(
+            mqtt_publish_packet(
+                self.topic.format(**reading._asdict()),
+                json.dumps(reading_to_dict(reading)).encode(),
+                self.retain,
+            )
+            for reading in records
+        )
+        try:
+            self._connect().sendall(data)
+        except OSError:
+            # One reconnect attempt - the broker may have dropped an idle connection
+            self.close_sync()
+            self._connect().sendall(data)
+
+    def close_sync(self):
+        if self._socket is not None:
+            try:
+                self._socket.sendall(b"\xe0\x00")  # DISCONNECT
+            except OSError:
+                pass
+            self._socket.close()
+            self._socket = None
+
+    def __str__(self) -> str:
+        return f"MqttSink({self.host}:{self.port})"
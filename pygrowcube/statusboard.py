@@ -0,0 +1,234 @@
+"""Shared-memory board of the latest Status of every GrowCube.
+
+One collector process publishes each Status it reads into a fixed-layout
+table in multiprocessing.shared_memory. Any number of local reader processes
+(exporter, alerting, UI) attach to the table by name and read the latest
+status of a device without opening their own connections to it.
+
+Each slot is guarded by a sequence counter (a seqlock): the writer makes it
+odd before changing the slot and even afterwards, and readers retry if the
+counter was odd or changed while they copied the slot. Neither side takes a
+lock, and readers never block the writer.
+"""
+import logging
+import struct
+import sys
+import zlib
+from collections import namedtuple
+from multiprocessing import resource_tracker, shared_memory
+from time import time
+
+from .pygrowcube import Status
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"GCSB"
+FORMAT_VERSION = 1
+SLOTS = 1024
+# magic, format version, slot count, slot size
+HEADER_FORMAT = "<4sHHH6x"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+SEQUENCE_FORMAT = "<I"
+SEQUENCE_SIZE = struct.calcsize(SEQUENCE_FORMAT)
+# updated, device id, host, version, temperature, humidity, moistures,
+# disconnected/locked/refreshed channel bits, has water
+BODY_FORMAT = "<d16s32s8shB4BBBBB"
+SLOT_SIZE = SEQUENCE_SIZE + struct.calcsize(BODY_FORMAT)
+MAX_RETRIES = 1000
+
+# A consistent copy of one slot
+BoardEntry = namedtuple(
+    "BoardEntry",
+    [
+        "updated",
+        "id",
+        "host",
+        "version",
+        "temperature",
+        "humidity",
+        "moistures",
+        "sensor_warnings",
+        "outlet_locks",
+        "refreshed_sensors",
+        "has_water",
+    ],
+)
+
+
+def _bits(flags) -> int:
+    return sum(1 << i for i, flag in enumerate(flags) if flag)
+
+
+def _unbits(bits: int) -> list:
+    return [bool(bits & (1 << i)) for i in range(4)]
+
+
+def _text(value: bytes) -> str:
+    return value.rstrip(b"\0").decode(errors="replace")
+
+
+class StatusBoard:
+    """Fixed-size table of the latest Status per device id in shared memory.
+
+    Use StatusBoard.create in the collector process and StatusBoard.attach in
+    readers.
+    """
+
+    def __init__(self, memory: shared_memory.SharedMemory, owner: bool):
+        self.memory = memory
+        self.owner = owner
+        self.buffer = memory.buf
+        magic, version, self.slots, slot_size = struct.unpack_from(
+            HEADER_FORMAT, self.buffer
+        )
+        if magic != MAGIC or version != FORMAT_VERSION or slot_size != SLOT_SIZE:
+            raise ValueError(f"Shared memory {memory.name} is not a status board")
+        self._slot_index = {}  # device id -> slot, a cache of the probing below
+
+    @classmethod
+    def create(cls, name: str = None, slots: int = SLOTS) -> "StatusBoard":
+        memory = shared_memory.SharedMemory(
+            name=name, create=True, size=HEADER_SIZE + slots * SLOT_SIZE
+        )
+        memory.buf[: HEADER_SIZE + slots * SLOT_SIZE] = bytes(
+            HEADER_SIZE + slots * SLOT_SIZE
+        )
+        struct.pack_into(
+            HEADER_FORMAT, memory.buf, 0, MAGIC, FORMAT_VERSION, slots, SLOT_SIZE
+        )
+        return cls(memory, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "StatusBoard":
+        if sys.version_info >= (3, 13):
+            memory = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            memory = shared_memory.SharedMemory(name=name)
+            # Before 3.13 attaching registers the segment with this process's
+            # resource tracker, which would unlink the board when a reader exits
+            resource_tracker.unregister(memory._name, "shared_memory")
+        return cls(memory, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    def _offset(self, slot: int) -> int:
+        return HEADER_SIZE + slot * SLOT_SIZE
+
+    def _slot_id(self, slot: int) -> bytes:
+        offset = self._offset(slot) + SEQUENCE_SIZE + 8
+        return bytes(self.buffer[offset : offset + 16]).rstrip(b"\0")
+
+    def _find(self, device_id: bytes, insert: bool) -> int:
+        """Open addressing with linear probing from a hash of the device id."""
+        start = zlib.crc32(device_id) % self.slots
+        for i in range(self.slots):
+            slot = (start + i) % self.slots
+            slot_id = self._slot_id(slot)
+            if slot_id == device_id:
+                return slot
+            if not slot_id:
+                return slot if insert else None
+        if insert:
+            raise ValueError(f"Status board is full ({self.slots} slots)")
+        return None
+
+    def publish(self, status: Status, updated: float = None):
+        """Write the latest Status of a device. Only one process may publish."""
+        device_id = (status.id or status.host).encode()[:16]
+        slot = self._slot_index.get(device_id)
+        if slot is None:
+            slot = self._slot_index[device_id] = self._find(device_id, insert=True)
+        offset = self._offset(slot)
+        sequence = struct.unpack_from(SEQUENCE_FORMAT, self.buffer, offset)[0]
+        writing = ((sequence + 1) | 1) & 0xFFFFFFFF
+        struct.pack_into(SEQUENCE_FORMAT, self.buffer, offset, writing)
+        struct.pack_into(
+            BODY_FORMAT,
+            self.buffer,
+            offset + SEQUENCE_SIZE,
+            time() if updated is None else updated,
+            device_id,
+            status.host.encode()[:32],
+            status.version.encode()[:8],
+            int(status.temperature),
+            int(status.humidity),
+            *(int(moisture) & 0xFF for moisture in status.moistures),
+            _bits(status.sensor_warnings),
+            _bits(status.outlet_locks),
+            _bits(status.refreshed_sensors),
+            int(bool(status.has_water)),
+        )
+        struct.pack_into(
+            SEQUENCE_FORMAT, self.buffer, offset, (writing + 1) & 0xFFFFFFFF
+        )
+
+    def _read(self, slot: int) -> BoardEntry:
+        offset = self._offset(slot)
+        for _ in range(MAX_RETRIES):
+            before = struct.unpack_from(SEQUENCE_FORMAT, self.buffer, offset)[0]
+            if before & 1:
+                continue
+            body = bytes(self.buffer[offset + SEQUENCE_SIZE : offset + SLOT_SIZE])
+            after = struct.unpack_from(SEQUENCE_FORMAT, self.buffer, offset)[0]
+            if before == after:
+                break
+        else:
+            raise TimeoutError(f"Status board slot {slot} kept changing while read")
+        fields = struct.unpack(BODY_FORMAT, body)
+        return BoardEntry(
+            fields[0],
+            _text(fields[1]),
+            _text(fields[2]),
+            _text(fields[3]),
+            fields[4],
+            fields[5],
+            list(fields[6:10]),
+            _unbits(fields[10]),
+            _unbits(fields[11]),
+            _unbits(fields[12]),
+            bool(fields[13]),
+        )
+
+    def get(self, device_id: str) -> BoardEntry:
+        """Return the latest entry for a device id, or None if never published."""
+        key = device_id.encode()[:16]
+        slot = self._slot_index.get(key)
+        if slot is None:
+            slot = self._find(key, insert=False)
+            if slot is None:
+                return None
+            self._slot_index[key] = slot
+        return self._read(slot)
+
+    def snapshot(self) -> dict:
+        """Return {device id: BoardEntry} for every device on the board."""
+        entries = {}
+        for slot in range(self.slots):
+            if self._slot_id(slot):
+                entry = self._read(slot)
+                entries[entry.id] = entry
+        return entries
+
+    @staticmethod
+    def to_status(entry: BoardEntry) -> Status:
+        status = Status(
+            temperature=entry.temperature,
+            humidity=entry.humidity,
+            moistures=list(entry.moistures),
+            sensor_warnings=list(entry.sensor_warnings),
+            outlet_locks=list(entry.outlet_locks),
+            version=entry.version,
+            id=entry.id,
+            host=entry.host,
+            has_water=entry.has_water,
+        )
+        status.refreshed_sensors = list(entry.refreshed_sensors)
+        return status
+
+    def close(self):
+        self.buffer = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
@@ -0,0 +1,359 @@
+"""Append-only binary store for readings.
+
+Each reading is a fixed 12 byte record (see RECORD_FORMAT) appended to a
+segment file per UTC day. Segments start with a small header; device ids are
+mapped to 16 bit indexes in devices.json alongside them. Readers mmap the
+segments, and when NumPy is installed get structured array views straight
+onto the mapped file without copying.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+from datetime import datetime, timezone
+
+from .pygrowcube import Reading
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional - queries fall back to lists of Readings
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"GCTS"
+FORMAT_VERSION = 1
+# magic, format version, record size, flags, UTC day start (epoch seconds)
+HEADER_FORMAT = "<4sHHIq"
+HEADER_SIZE = 32
+HEADER_SORTED = 1  # all records in the segment are in timestamp order
+# timestamp, device index, channel, moisture, humidity, temperature, flags, padding
+RECORD_FORMAT = "<IHBBBbBx"
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+SEGMENT_SUFFIX = ".gcts"
+DEVICES_FILE = "devices.json"
+
+if numpy is not None:
+    RECORD_DTYPE = numpy.dtype(
+        {
+            "names": [
+                "timestamp",
+                "device",
+                "channel",
+                "moisture",
+                "humidity",
+                "temperature",
+                "flags",
+            ],
+            "formats": ["<u4", "<u2", "u1", "u1", "u1", "i1", "u1"],
+            "offsets": [0, 4, 6, 7, 8, 9, 10],
+            "itemsize": RECORD_SIZE,
+        }
+    )
+
+
+def _day_start(timestamp: float) -> int:
+    return int(timestamp) - int(timestamp) % 86400
+
+
+def _segment_name(day_start: int) -> str:
+    day = datetime.fromtimestamp(day_start, tz=timezone.utc)
+    return day.strftime("%Y-%m-%d") + SEGMENT_SUFFIX
+
+
+class _Segment:
+    """A mapped, read-only view of one day's segment file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.size = os.fstat(f.fileno()).st_size
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, self.flags, self.day_start = struct.unpack_from(
+            HEADER_FORMAT, self.map
+        )
+        if magic != MAGIC or version != FORMAT_VERSION or record_size != RECORD_SIZE:
+            raise ValueError(f"Not a GrowCube time series segment: {path}")
+        self.count = (self.size - HEADER_SIZE) // RECORD_SIZE
+
+    @property
+    def is_sorted(self) -> bool:
+        return bool(self.flags & HEADER_SORTED)
+
+    def timestamp(self, i: int) -> int:
+        return struct.unpack_from("<I", self.map, HEADER_SIZE + i * RECORD_SIZE)[0]
+
+    def bounds(self, start: float, end: float) -> tuple:
+        """Binary search the record range [lo, hi) with start <= timestamp < end."""
+        return self._search(start), self._search(end)
+
+    def _search(self, timestamp: float) -> int:
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamp(mid) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def array(self):
+        """Zero-copy structured NumPy array over all records."""
+        return numpy.frombuffer(
+            self.map, dtype=RECORD_DTYPE, count=self.count, offset=HEADER_SIZE
+        )
+
+    def records(self, lo: int, hi: int):
+        view = memoryview(self.map)[
+            HEADER_SIZE + lo * RECORD_SIZE : HEADER_SIZE + hi * RECORD_SIZE
+        ]
+        return struct.iter_unpack(RECORD_FORMAT, view)
+
+
+class TimeSeriesStore:
+    """Directory of per-day segment files holding Readings.
+
+    Args:
+        path (str): Directory for the store. Created if it doesn't exist.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.devices = []
+        self._device_indexes = {}
+        self._last_timestamps = {}  # day start -> last timestamp appended
+        self._segments = {}
+        self._devices_mtime = None
+        self._load_devices()
+
+    def _load_devices(self):
+        """(Re)load devices.json if a writer has changed it since it was read."""
+        devices_path = os.path.join(self.path, DEVICES_FILE)
+        try:
+            mtime = os.stat(devices_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._devices_mtime:
+            return
+        with open(devices_path) as f:
+            self.devices = json.load(f)
+        self._device_indexes = {d: i for i, d in enumerate(self.devices)}
+        self._devices_mtime = mtime
+
+    def _find_device_index(self, device: str) -> int:
+        """Return the index of device, or None if no writer has registered it."""
+        index = self._device_indexes.get(device)
+        if index is None:
+            self._load_devices()
+            index = self._device_indexes.get(device)
+        return index
+
+    def device_name(self, index: int) -> str:
+        if index >= len(self.devices):
+            self._load_devices()
+        return self.devices[index]
+
+    def device_index(self, device: str) -> int:
+        index = self._find_device_index(device)
+        if index is None:
+            if len(self.devices) > 0xFFFF:
+                raise ValueError("Too many devices for a 16 bit device index")
+            index = self._device_indexes[device] = len(self.devices)
+            self.devices.append(device)
+            devices_path = os.path.join(self.path, DEVICES_FILE)
+            with open(devices_path + ".tmp", "w") as f:
+                json.dump(self.devices, f)
+            os.replace(devices_path + ".tmp", devices_path)
+            self._devices_mtime = os.stat(devices_path).st_mtime_ns
+        return index
+
+    def _segment_path(self, day_start: int) -> str:
+        return os.path.join(self.path, _segment_name(day_start))
+
+    def _last_timestamp(self, day_start: int, path: str) -> int:
+        if day_start not in self._last_timestamps:
+            last = -1
+            size = os.path.getsize(path)
+            if size >= HEADER_SIZE + RECORD_SIZE:
+                with open(path, "rb") as f:
+                    f.seek(
+                        HEADER_SIZE
+                        + ((size - HEADER_SIZE) // RECORD_SIZE - 1) * RECORD_SIZE
+                    )
+                    last = struct.unpack("<I", f.read(4))[0]
+            self._last_timestamps[day_start] = last
+        return self._last_timestamps[day_start]
+
+    def append(self, readings):
+        """Append an iterable of Readings, creating segments as needed."""
+        by_day = {}
+        for reading in readings:
+            by_day.setdefault(_day_start(reading.timestamp), []).append(reading)
+
+        for day_start, day_readings in by_day.items():
+            path = self._segment_path(day_start)
+            if not os.path.exists(path) or os.path.getsize(path) < HEADER_SIZE:
+                self._last_timestamps.pop(day_start, None)
+                with open(path, "wb") as f:
+                    header = struct.pack(
+                        HEADER_FORMAT,
+                        MAGIC,
+                        FORMAT_VERSION,
+                        RECORD_SIZE,
+                        HEADER_SORTED,
+                        day_start,
+                    )
+                    f.write(header.ljust(HEADER_SIZE, b"\0"))
+            last = self._last_timestamp(day_start, path)
+            buffer = bytearray(RECORD_SIZE * len(day_readings))
+            in_order = True
+            for i, reading in enumerate(day_readings):
+                timestamp = int(reading.timestamp)
+                in_order = in_order and timestamp >= last
+                last = max(last, timestamp)
+                struct.pack_into(
+                    RECORD_FORMAT,
+                    buffer,
+                    i * RECORD_SIZE,
+                    timestamp,
+                    self.device_index(reading.device),
+                    reading.channel,
+                    reading.moisture,
+                    reading.humidity,
+                    reading.temperature,
+                    reading.flags,
+                )
+            with open(path, "r+b") as f:
+                if not in_order:
+                    # Range queries can't binary search this segment any more
+                    header = bytearray(f.read(HEADER_SIZE))
+                    _, _, _, flags, _ = struct.unpack_from(HEADER_FORMAT, header)
+                    struct.pack_into("<I", header, 8, flags & ~HEADER_SORTED)
+                    f.seek(0)
+                    f.write(header)
+                size = f.seek(0, os.SEEK_END)
+                records_end = (
+                    HEADER_SIZE + (size - HEADER_SIZE) // RECORD_SIZE * RECORD_SIZE
+                )
+                if records_end != size:
+                    # Drop a record torn by an interrupted write so the ones
+                    # appended after it stay aligned
+                    logger.warning(
+                        "Truncating %d trailing bytes of %s", size - records_end, path
+                    )
+                    f.truncate(records_end)
+                    f.seek(records_end)
+                f.write(buffer)
+            self._last_timestamps[day_start] = last
+
+    def _segment(self, day_start: int) -> _Segment:
+        path = self._segment_path(day_start)
+        if not os.path.exists(path):
+            return None
+        segment = self._segments.get(day_start)
+        if segment is None or segment.size != os.path.getsize(path):
+            # (Re)map to pick up records appended since it was last mapped
+            segment = self._segments[day_start] = _Segment(path)
+        return segment
+
+    def segments(self, start: float, end: float):
+        """Yield the mapped segments overlapping [start, end)."""
+        first_day = _day_start(start)
+        for day_start in self.days():
+            if not first_day <= day_start < end:
+                continue
+            segment = self._segment(day_start)
+            if segment is not None and segment.count:
+                yield segment
+
+    def days(self) -> list:
+        """Return the UTC day start of every segment in the store."""
+        days = []
+        for name in sorted(os.listdir(self.path)):
+            if name.endswith(SEGMENT_SUFFIX):
+                day = datetime.strptime(name[: -len(SEGMENT_SUFFIX)], "%Y-%m-%d")
+                days.append(int(day.replace(tzinfo=timezone.utc).timestamp()))
+        return days
+
+    def query_arrays(self, start: float, end: float):
+        """Yield a structured NumPy array per segment for start <= timestamp < end.
+
+        Arrays from sorted segments are views onto the mapped files - no data is
+        copied. Requires NumPy.
+        """
+        if numpy is None:
+            raise ImportError("NumPy is required for array queries")
+        for segment in self.segments(start, end):
+            if segment.is_sorted:
+                lo, hi = segment.bounds(start, end)
+                if hi > lo:
+                    yield segment.array()[lo:hi]
+            else:
+                records = segment.array()
+                mask = (records["timestamp"] >= start) & (records["timestamp"] < end)
+                if mask.any():
+                    yield records[mask]
+
+    def query(self, start: float, end: float, device: str = None, channel: int = None):
+        """Return the readings with start <= timestamp < end.
+
+        With NumPy installed this is a single structured array (copied only when
+        it spans several segments or is filtered), otherwise a list of Readings.
+        """
+        device_index = None
+        if device is not None:
+            device_index = self._find_device_index(device)
+            if device_index is None:
+                return numpy.empty(0, RECORD_DTYPE) if numpy is not None else []
+
+        if numpy is not None:
+            arrays = list(self.query_arrays(start, end))
+            if not arrays:
+                return numpy.empty(0, RECORD_DTYPE)
+            records = arrays[0] if len(arrays) == 1 else numpy.concatenate(arrays)
+            if device_index is not None:
+                records = records[records["device"] == device_index]
+            if channel is not None:
+                records = records[records["channel"] == channel]
+            return records
+
+        readings = []
+        for segment in self.segments(start, end):
+            lo, hi = (
+                segment.bounds(start, end) if segment.is_sorted else (0, segment.count)
+            )
+            for record in segment.records(lo, hi):
+                timestamp, index, record_channel = record[0], record[1], record[2]
+                if not start <= timestamp < end:
+                    continue
+                if device_index is not None and index != device_index:
+                    continue
+                if channel is not None and record_channel != channel:
+                    continue
+                readings.append(
+                    Reading(self.device_name(index), *((timestamp,) + record[2:]))
+                )
+        return readings
+
+    def to_readings(self, records) -> list:
+        """Convert a structured array from query() back into Readings."""
+        if isinstance(records, list):
+            return records
+        return [
+            Reading(
+                self.device_name(int(r["device"])),
+                int(r["timestamp"]),
+                int(r["channel"]),
+                int(r["moisture"]),
+                int(r["humidity"]),
+                int(r["temperature"]),
+                int(r["flags"]),
+            )
+            for r in records
+        ]
+
+    def close(self):
+        """Drop the cached mappings. Arrays returned by queries keep their own reference."""
+        self._segments.clear()
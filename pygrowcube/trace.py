@@ -0,0 +1,58 @@
+"""Bounded in-memory trace of recent traffic on a connection.
+
+Recording an event is just a deque append of a tuple, so a TraceBuffer can be
+left on in the field. The buffer is only formatted when something goes wrong
+(a parse error or time out), giving the frames leading up to the failure
+without paying for logging every frame.
+"""
+import logging
+from collections import deque
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+TRACE_SIZE = 200  # events kept per connection
+
+
+class TraceBuffer:
+    """Ring buffer of the last `size` events on a connection.
+
+    Args:
+        size (int): Number of events to keep.
+        name (str): Identifies the connection in dumps, e.g. host:port.
+    """
+
+    def __init__(self, size: int = TRACE_SIZE, name: str = ""):
+        self.name = name
+        self.events = deque(maxlen=size)
+        self.start = perf_counter()
+        self.dumps = 0
+
+    def record(self, kind: str, data=None):
+        """Record an event such as "rx", "tx", "timeout" or "error"."""
+        self.events.append((perf_counter(), kind, data))
+
+    def format(self) -> str:
+        lines = []
+        for timestamp, kind, data in self.events:
+            if isinstance(data, (bytes, bytearray)):
+                data = bytes(data)
+            lines.append(f"{timestamp - self.start:10.3f} {kind:<8} {data!r}")
+        return "\n".join(lines)
+
+    def dump(self, reason: str, level: int = logging.WARNING) -> str:
+        """Log the buffered events and return them as text."""
+        self.dumps += 1
+        text = self.format()
+        logger.log(
+            level,
+            "Trace of last %s events on %s (%s):\n%s",
+            len(self.events),
+            self.name,
+            reason,
+            text,
+        )
+        return text
+
+    def __len__(self) -> int:
+        return len(self.events)
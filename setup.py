@@ -21,15 +21,13 @@ test_requirements = [
 setup(
     author="Edward Fretwell",
     author_email="pypi@comfortableshoe.co.uk",
-    python_requires=">=3.6",
+    python_requires=">=3.8",
     classifiers=[
         "Development Status :: 2 - Pre-Alpha",
         "Intended Audience :: Developers",
         "License :: OSI Approved :: MIT License",
         "Natural Language :: English",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.6",
-        "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
     ],
     description="Python modules for interacting with Elecrow GrowCube smart plant watering system",
@@ -39,6 +37,7 @@ setup(
         ],
     },
     install_requires=requirements,
+    extras_require={"numpy": ["numpy"], "uvloop": ["uvloop"]},
     license="MIT license",
     long_description=readme + "\n\n" + history,
     include_package_data=True,
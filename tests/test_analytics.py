@@ -0,0 +1,94 @@
+"""Tests for fleet moisture analytics."""
+from datetime import date, datetime
+
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+from pygrowcube import analytics  # noqa: E402
+from pygrowcube.message import Message  # noqa: E402
+from pygrowcube.pygrowcube import (  # noqa: E402
+    SensorHistory,
+    WateringEvent,
+    parse_sensor_history,
+)
+
+
+def drying(channel, day, start, rate):
+    return SensorHistory(channel, day, [round(start - rate * h) for h in range(24)])
+
+
+def fleet():
+    return {
+        "fast": [
+            drying(0, date(2023, 8, 28), 80, 1),
+            # watered at 06:00 on the 29th, then drying at 2%/hour
+            SensorHistory(
+                0,
+                date(2023, 8, 29),
+                [57, 56, 55, 54, 53, 52, 90] + [90 - 2 * h for h in range(1, 18)],
+            ),
+        ],
+        "slow": [
+            drying(1, date(2023, 8, 28), 70, 0.25),
+            drying(1, date(2023, 8, 29), 64, 0.25),
+        ],
+    }
+
+
+def test_parse_sensor_history():
+    message = Message(
+        "elea22#83#0@2023@8@28@00,00,00,00,00,00,00,00,00,00,00,74,81,84,85,86,86,85,86,85,85,84,84,83#"
+    )
+    entry = parse_sensor_history(message)
+    assert entry.channel == 0
+    assert entry.date == date(2023, 8, 28)
+    assert entry.moistures[11] == 74
+
+
+def test_history_array_and_daily_stats():
+    devices, dates, history = analytics.history_array(fleet())
+    assert devices == ["fast", "slow"]
+    assert dates == [date(2023, 8, 28), date(2023, 8, 29)]
+    assert history.shape == (2, 2, 24, 4)
+    low, mean, high = analytics.daily_stats(history)
+    assert high[0, 1, 0] == 90
+    assert low[1, 0, 1] == 64
+    assert numpy.isnan(mean[0, 0, 3])
+
+
+def test_watering_drying_and_ranking():
+    devices, _, history = analytics.history_array(fleet())
+    since = analytics.hours_since_watering(history)
+    assert since[0, 0] == 17
+    assert numpy.isnan(since[1, 1])
+    rate = analytics.drying_rate(history)
+    assert rate[0, 0] == pytest.approx(2)
+    assert rate[1, 1] == pytest.approx(0.25, abs=0.02)
+
+    ranked = analytics.rank_channels(devices, history, minimums=40)
+    assert [(r.device, r.channel) for r in ranked] == [("fast", 0), ("slow", 1)]
+    assert ranked[0].moisture == 56
+    assert ranked[0].hours_until_minimum == pytest.approx(8)
+
+
+def test_watering_events_preferred_over_moisture_rise():
+    devices, dates, history = analytics.history_array(fleet())
+    waterings = analytics.watering_array(
+        {
+            "slow": [WateringEvent(1, datetime(2023, 8, 29, 12, 10))],
+            "unknown": [WateringEvent(0, datetime(2023, 8, 29, 1, 0))],
+        },
+        devices,
+        dates,
+    )
+    assert waterings.sum() == 1
+    since = analytics.hours_since_watering(history, waterings=waterings)
+    # "slow" has no rise in moisture but an event at 12:10 on the 29th
+    assert since[1, 1] == 47 - 36
+    # "fast" has no events so the rise at 06:00 is still used
+    assert since[0, 0] == 17
+    rate = analytics.drying_rate(history, waterings=waterings)
+    assert rate[1, 1] == pytest.approx(0.25, abs=0.02)
+    ranked = analytics.rank_channels(devices, history, 40, waterings=waterings)
+    assert ranked[1].hours_since_watering == 11
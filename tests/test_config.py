@@ -0,0 +1,154 @@
+"""Tests for smart watering configuration sync."""
+import asyncio
+import re
+
+from pygrowcube import config, timeouthelper
+
+FRAME = re.compile(rb"ele506|elea\d+#\d+#[^#]*#")
+
+
+class FakeGrowCube:
+    def __init__(self, ignore=()):
+        self.connections = 0
+        self.commands = []
+        self.ignore = set(ignore)  # commands to drop without acknowledging
+
+    async def __call__(self, reader, writer):
+        self.connections += 1
+        buffer = b""
+        while True:
+            data = await reader.read(1024)
+            if not data:
+                break
+            buffer += data
+            while True:
+                frame = FRAME.search(buffer)
+                if frame is None:
+                    break
+                buffer = buffer[frame.end() :]
+                command = frame.group().decode()
+                if command.startswith("elea44#"):
+                    writer.write(b"elea24#11#3.6@4063809#")
+                elif command == "ele506":
+                    writer.write(b"ele550")
+                elif command in self.ignore:
+                    self.ignore.discard(command)
+                else:
+                    self.commands.append(command)
+                    writer.write(b"elea20#1#1#")
+            await writer.drain()
+        writer.close()
+
+
+def test_only_changed_channels_sent():
+    device = FakeGrowCube()
+
+    async def run():
+        server = await asyncio.start_server(device, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        sync = config.ConfigSync(command_interval=0, port=port)
+        async with server:
+            plan = {0: config.smart(30, 60), 1: config.regular("30s", 6)}
+            first = await sync.sync({"127.0.0.1": plan})
+            second = await sync.sync({"127.0.0.1": plan})
+            plan[1] = None
+            third = await sync.sync({"127.0.0.1": plan})
+        return sync, first, second, third
+
+    sync, first, second, third = asyncio.run(run())
+    assert first == {"127.0.0.1": 2}
+    assert second == {"127.0.0.1": 0}
+    assert third == {"127.0.0.1": 1}
+    assert device.connections == 2
+    assert device.commands == [
+        "elea49#9#0@3@30@60#",
+        "elea49#9#1@1@30s@6#",
+        "elea45#1#1#",
+        "elea46#1#1#",
+    ]
+    assert sync.cache.get("4063809")[1] is None
+
+
+def test_sync_long_after_import(monkeypatch):
+    # Run as if the process had been up an hour, well past any timeout created
+    # when the modules were imported
+    perf_counter = timeouthelper.perf_counter
+    monkeypatch.setattr(timeouthelper, "perf_counter", lambda: perf_counter() + 3600)
+    device = FakeGrowCube()
+
+    async def run():
+        server = await asyncio.start_server(device, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        sync = config.ConfigSync(command_interval=0, port=port)
+        async with server:
+            return await sync.sync({"127.0.0.1": {0: config.smart(30, 60)}})
+
+    assert asyncio.run(run()) == {"127.0.0.1": 1}
+
+
+def test_unacknowledged_channel_is_resent(monkeypatch):
+    monkeypatch.setattr(config, "ACK_TIMEOUT", 0.2)
+    device = FakeGrowCube(ignore=["elea49#9#1@1@30s@6#"])
+
+    async def run():
+        server = await asyncio.start_server(device, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        sync = config.ConfigSync(command_interval=0, port=port)
+        async with server:
+            plan = {0: config.smart(30, 60), 1: config.regular("30s", 6)}
+            first = await sync.sync({"127.0.0.1": plan})
+            unconfirmed = dict(sync.cache.get("4063809"))
+            second = await sync.sync({"127.0.0.1": plan})
+        return sync, first, unconfirmed, second
+
+    sync, first, unconfirmed, second = asyncio.run(run())
+    error = first["127.0.0.1"]
+    assert isinstance(error, config.SettingsNotAcknowledged)
+    assert error.channels == [1] and error.applied == 1
+    assert unconfirmed[1] == config.UNCONFIRMED
+    assert second == {"127.0.0.1": 1}
+    assert device.commands == ["elea49#9#0@3@30@60#", "elea49#9#1@1@30s@6#"]
+    assert sync.cache.get("4063809")[1] == config.regular("30s", 6)
+
+
+def test_delete_acks_not_taken_for_next_command(monkeypatch):
+    monkeypatch.setattr(config, "ACK_TIMEOUT", 0.2)
+    device = FakeGrowCube(ignore=["elea49#9#1@3@30@60#"])
+
+    async def run():
+        server = await asyncio.start_server(device, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        cache = config.SettingsCache()
+        cache.update("4063809", {0: config.smart(30, 60)})
+        sync = config.ConfigSync(cache, command_interval=0, port=port)
+        async with server:
+            plan = {0: None, 1: config.smart(30, 60)}
+            result = await sync.sync({"127.0.0.1": plan})
+        return sync, result
+
+    sync, result = asyncio.run(run())
+    error = result["127.0.0.1"]
+    assert isinstance(error, config.SettingsNotAcknowledged)
+    assert error.channels == [1] and error.applied == 1
+    assert sync.cache.get("4063809") == {0: None, 1: config.UNCONFIRMED}
+
+
+def test_cache_persisted(tmp_path):
+    path = str(tmp_path / "settings.json")
+    cache = config.SettingsCache(path)
+    cache.device_ids["cube"] = "4063809"
+    cache.update(
+        "4063809",
+        {2: config.smart_outside_sunlight(10, 50), 3: None, 1: config.UNCONFIRMED},
+    )
+    cache.save()
+    loaded = config.SettingsCache(path)
+    assert loaded.get("4063809") == {
+        2: config.ChannelSettings(2, 10, 50),
+        3: None,
+        1: config.UNCONFIRMED,
+    }
+    assert not config.diff_plan(
+        loaded.get("4063809"), {2: config.smart_outside_sunlight(10, 50)}
+    )
+    assert config.diff_plan(loaded.get("4063809"), {1: None}) == {1: None}
@@ -0,0 +1,42 @@
+"""Tests for the change-detection filter."""
+from pygrowcube.deadband import DeadbandFilter
+from pygrowcube.pygrowcube import FLAG_OUTLET_LOCKED, Reading, Status
+
+
+def reading(timestamp, moisture, flags=0):
+    return Reading("cube", timestamp, 0, moisture, 45, 27, flags)
+
+
+def test_small_drift_suppressed_until_heartbeat():
+    deadband = DeadbandFilter(moisture=2, heartbeat=60)
+    accepted = [
+        deadband.accept(reading(t, 80 + (t // 10) % 2)) for t in range(0, 60, 10)
+    ]
+    assert accepted == [True, False, False, False, False, False]
+    assert deadband.accept(reading(60, 81))
+    assert deadband.summary()["suppressed_readings"] == 5
+
+
+def test_changes_and_flags_emitted():
+    deadband = DeadbandFilter(moisture=2, heartbeat=None)
+    assert deadband.accept(reading(0, 80))
+    assert not deadband.accept(reading(10, 81))
+    assert deadband.accept(reading(20, 78))
+    assert deadband.accept(reading(30, 78, FLAG_OUTLET_LOCKED))
+    assert deadband.summary()["by_reason"] == {
+        "first": 1,
+        "flags": 1,
+        "change": 1,
+        "heartbeat": 0,
+    }
+
+
+def test_status_updates():
+    deadband = DeadbandFilter()
+    status = Status(temperature=27, humidity=45, id="4063809")
+    status.refreshed_sensors = [True] * 4
+    assert deadband.accept(status, now=0)
+    status.moistures[2] = 1
+    assert not deadband.accept(status, now=10)
+    status.has_water = False
+    assert deadband.accept(status, now=20)
@@ -0,0 +1,100 @@
+"""Tests for the cached status exporter."""
+import asyncio
+import json
+
+from pygrowcube.exporter import (
+    MetricsExporter,
+    StatusCache,
+    format_json,
+    format_prometheus,
+)
+from pygrowcube.pygrowcube import Status
+
+
+def make_status(host, moisture=50):
+    status = Status(temperature=21, humidity=45, id="4063809", host=host)
+    status.moistures = [moisture, 0, 0, 0]
+    status.refreshed_sensors = [True, True, True, True]
+    status.sensor_warnings[1] = True
+    return status
+
+
+class FakeDevice:
+    def __init__(self, delay=0.05):
+        self.calls = 0
+        self.delay = delay
+
+    async def __call__(self, host, timeout):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return make_status(host, moisture=self.calls)
+
+
+def test_concurrent_requests_are_coalesced():
+    device = FakeDevice()
+    cache = StatusCache(ttl=10, fetch=device)
+
+    async def scrape():
+        return await asyncio.gather(*(cache.get("cube") for _ in range(20)))
+
+    statuses = asyncio.run(scrape())
+    assert device.calls == 1
+    assert all(status is statuses[0] for status in statuses)
+
+
+def test_stale_status_served_while_revalidating():
+    device = FakeDevice()
+    cache = StatusCache(ttl=0, stale_ttl=60, fetch=device)
+
+    async def scrape():
+        first = await cache.get("cube")
+        second = await cache.get("cube")  # stale, refresh starts in background
+        await asyncio.sleep(0.1)
+        third = await cache.get("cube")
+        return first, second, third
+
+    first, second, third = asyncio.run(scrape())
+    assert second is first
+    assert third.moistures[0] == 2
+    assert device.calls == 3
+
+
+def test_prometheus_and_json_output():
+    results = {"cube": make_status("cube", moisture=82), "offline": None}
+    text = format_prometheus(results, {"cube": 1.5})
+    assert (
+        'growcube_moisture_percent{host="cube",device="4063809",channel="0"} 82' in text
+    )
+    assert (
+        'growcube_sensor_disconnected{host="cube",device="4063809",channel="1"} 1'
+        in text
+    )
+    assert 'growcube_up{host="offline"} 0' in text
+    assert "# TYPE growcube_has_water gauge" in text
+    document = json.loads(format_json(results))
+    assert document["cube"]["moistures"][0] == 82
+    assert document["offline"] is None
+
+
+def test_exporter_render():
+    exporter = MetricsExporter(["cube"], StatusCache(fetch=FakeDevice(0)))
+    status, content_type, body = asyncio.run(exporter.render("/metrics"))
+    assert status == "200 OK"
+    assert 'growcube_up{host="cube",device="4063809"} 1' in body
+    status, _, _ = asyncio.run(exporter.render("/nothing"))
+    assert status == "404 Not Found"
+
+
+def test_exporter_only_reads_configured_targets():
+    cache = StatusCache(fetch=FakeDevice(0))
+    exporter = MetricsExporter(["cube"], cache)
+    status, _, body = asyncio.run(exporter.render("/status.json?target=10.0.0.1"))
+    assert status == "400 Bad Request"
+    assert "10.0.0.1" in body
+    assert cache.fetch_count == 0
+    status, _, _ = asyncio.run(exporter.render("/status.json?target=cube"))
+    assert status == "200 OK"
+
+    exporter = MetricsExporter(["cube"], cache, allow_any_target=True)
+    status, _, _ = asyncio.run(exporter.render("/status.json?target=10.0.0.1"))
+    assert status == "200 OK"
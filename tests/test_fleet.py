@@ -0,0 +1,29 @@
+"""Tests for fleet status collection."""
+import asyncio
+
+from pygrowcube.fleet import FleetCollector
+from pygrowcube.pygrowcube import Status
+from pygrowcube.scheduler import PollScheduler
+
+
+def test_failing_handler_does_not_stop_fleet():
+    handled = []
+
+    async def fetch(host, timeout, message_callback=None):
+        return Status(host=host)
+
+    def handler(status):
+        handled.append(status.host)
+        if status.host == "a":
+            raise RuntimeError("sink down")
+
+    collector = FleetCollector(
+        ["a", "b"],
+        handler,
+        interval=0.01,
+        scheduler=PollScheduler(period=0.01),
+        fetch=fetch,
+    )
+    asyncio.run(collector.run(rounds=2))
+    assert sorted(handled) == ["a", "a", "b", "b"]
+    assert collector.handler_errors == 2
@@ -0,0 +1,65 @@
+"""Tests for pipelined history fetch."""
+import asyncio
+from time import perf_counter
+
+from pygrowcube import pygrowcube
+
+FRAMES = [
+    b"elea24#11#3.6@4063809#",
+    b"elea22#83#0@2023@8@28@00,00,00,00,00,00,00,00,00,00,00,74,81,84,85,86,86,85,86,85,85,84,84,83#",
+    b"elea22#83#1@2023@8@28@00,00,00,00,00,00,00,00,00,00,00,70,81,84,85,86,86,85,86,85,85,84,84,83#",
+    b"elea35#3#0@1#",
+    b"elea23#17#0@2023@8@28@11@49#",
+    b"elea22#83#1@2023@8@29@82,81,81,81,81,80,80,81,81,81,80,80,83,84,84,84,84,00,00,00,00,00,00,00#",
+    b"elea21#10#0@84@47@27#",
+]
+
+
+def test_history_for_all_channels_on_one_connection(monkeypatch):
+    histories, requests = fetch_history(monkeypatch, FRAMES)
+    # All channels were requested before the GrowCube sent any history
+    assert b"elea48#1#0#" in requests
+    assert b"elea48#1#1#" in requests
+    assert [entry.date.day for entry in histories[1].moistures] == [28, 29]
+    assert histories[0].moistures[0].moistures[11] == 74
+    assert histories[0].waterings[0].time.minute == 49
+
+
+def test_invalid_entry_skipped(monkeypatch):
+    frames = FRAMES[:4] + [b"elea23#14#0@2023@8@28@11#"] + FRAMES[4:]
+    histories, _ = fetch_history(monkeypatch, frames)
+    assert [entry.date.day for entry in histories[1].moistures] == [28, 29]
+    assert len(histories[0].waterings) == 1
+
+
+def test_idle_timeout_starts_with_first_frame(monkeypatch):
+    start = perf_counter()
+    histories, _ = fetch_history(monkeypatch, FRAMES[:1])
+    assert perf_counter() - start < 5
+    assert histories[0].moistures == []
+
+
+def fetch_history(monkeypatch, frames):
+    requests = bytearray()
+
+    async def fake_growcube(reader, writer):
+        writer.write(frames[0])  # VERSION on connect
+        while b"elea48#1#1#" not in requests:
+            data = await reader.read(1024)
+            if not data:
+                break
+            requests.extend(data)
+        writer.write(b"\x00".join(frames[1:]))
+        await writer.drain()
+        await reader.read()  # until the client closes
+        writer.close()
+
+    async def fetch():
+        server = await asyncio.start_server(fake_growcube, "127.0.0.1", 0)
+        monkeypatch.setattr(pygrowcube, "PORT", server.sockets[0].getsockname()[1])
+        async with server:
+            return await pygrowcube.get_history(
+                "127.0.0.1", channels=[0, 1], idle_timeout=0.2
+            )
+
+    return asyncio.run(fetch()), requests
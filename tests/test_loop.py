@@ -0,0 +1,81 @@
+"""Tests for event loop backend selection."""
+import asyncio
+import subprocess
+import sys
+
+import pytest
+
+from pygrowcube import loop
+
+
+async def loop_module():
+    await asyncio.sleep(0)
+    return type(asyncio.get_running_loop()).__module__
+
+
+def test_run_on_asyncio():
+    assert loop.run(loop_module(), loop.ASYNCIO).startswith("asyncio")
+
+
+def test_auto_prefers_uvloop_when_installed():
+    expected = loop.ASYNCIO if loop.uvloop is None else loop.UVLOOP
+    assert loop.resolve_backend() == expected
+
+
+@pytest.mark.skipif(loop.uvloop is None, reason="uvloop not installed")
+def test_run_on_uvloop():
+    assert loop.run(loop_module(), loop.UVLOOP).startswith("uvloop")
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        loop.resolve_backend("trio")
+
+
+def test_run_cancels_leftover_tasks_and_calls_setup():
+    loops = []
+    cancelled = []
+
+    async def forever():
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        asyncio.ensure_future(forever())
+        await asyncio.sleep(0)
+        return 42
+
+    assert loop.run(main(), loop.ASYNCIO, setup=loops.append) == 42
+    assert cancelled == [True]
+    assert loops[0].is_closed()
+
+
+def test_cli_help_does_not_import_library():
+    code = (
+        "import sys; from click.testing import CliRunner; "
+        "from pygrowcube.cli import main; "
+        "CliRunner().invoke(main, ['status', '--help']); "
+        "print('asyncio' in sys.modules, 'pygrowcube.pygrowcube' in sys.modules)"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.split() == ["False", "False"]
+
+
+def test_missing_uvloop_rejected(monkeypatch):
+    from click.testing import CliRunner
+
+    from pygrowcube import cli
+
+    monkeypatch.setattr(loop, "uvloop", None)
+    with pytest.raises(RuntimeError):
+        loop.run(loop_module(), loop.UVLOOP)
+
+    monkeypatch.setattr(cli.importlib.util, "find_spec", lambda name: None)
+    result = CliRunner().invoke(cli.main, ["status", "127.0.0.1", "--loop", "uvloop"])
+    assert result.exit_code == 2
+    assert "uvloop is not installed" in result.output
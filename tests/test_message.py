@@ -0,0 +1,166 @@
+"""Tests for message encoding and decoding."""
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from pygrowcube import pygrowcube
+from pygrowcube.message import FrameDecoder, Message, MessageType, encode_message
+from pygrowcube.messageclient import MessageClient
+from pygrowcube.timeouthelper import TimeoutHelper
+
+
+def test_constant_frames_are_reused():
+    first = Message(message_type=MessageType.REQUEST_READINGS, message_content="2")
+    second = Message(message_type=MessageType.REQUEST_READINGS, message_content="2")
+    assert first.encode() == b"elea43#1#2#"
+    assert first.encode() is second.encode()
+    assert encode_message(MessageType.REQUEST_READY_FOR_COMMAND) == b"ele506"
+
+
+def test_hello_frame():
+    timestamp = Message.format_datetime_for_growcube(datetime(2023, 9, 5, 11, 53, 30))
+    hello = Message(message_type=MessageType.REQUEST_HELLO, message_content=timestamp)
+    assert hello.encode() == b"elea44#19#2023@09@05@11@53@30#"
+    assert hello.encode().decode() == hello.get_message()
+
+
+def decode_all(*chunks, final=False):
+    decoder = FrameDecoder()
+    messages = []
+    for chunk in chunks:
+        decoder.feed(chunk)
+        while True:
+            message = decoder.next_message()
+            if message is None:
+                break
+            messages.append((message.message_type, message.message_content))
+    message = decoder.next_message(final)
+    if message is not None:
+        messages.append((message.message_type, message.message_content))
+    return decoder, messages
+
+
+def test_decode_padding_and_command_frames():
+    decoder, messages = decode_all(b"\x00\x00ele550\x00elea24#11#3.6@4063809#")
+    assert messages == [(550, ""), (24, "3.6@4063809")]
+    assert decoder.skipped_bytes == 0
+
+
+def test_decode_frames_split_across_reads():
+    stream = b"elea30#1#2#elea33#3#0@0#elea21#10#0@82@45@27#"
+    decoder, messages = decode_all(*(stream[i : i + 1] for i in range(len(stream))))
+    assert messages == [(30, "2"), (33, "0@0"), (21, "0@82@45@27")]
+    assert decoder.skipped_bytes == 0
+
+
+def test_resync_after_corrupt_frames():
+    decoder, messages = decode_all(
+        b"#elea23#17#0@2023@8@28@11@49"  # stray leading #, missing trailing #
+        b"elea21#xx#"  # corrupt length
+        b"\xff\xfegarbage"
+        b"elea21#12#1@0@45@27#"  # length too long
+        b"elea21#9#2@0@45@27#"
+        b"elea21#8#3@0@45@27#"  # length too short
+        b"elea21#10#0@82@45@27#"
+        b"elea30#1#2\x00\x00elea33#3#0@0#"  # missing trailing #, then padding
+    )
+    assert messages == [
+        (23, "0@2023@8@28@11@49"),
+        (21, "2@0@45@27"),
+        (21, "0@82@45@27"),
+        (30, "2"),
+        (33, "0@0"),
+    ]
+    assert decoder.skipped_bytes == len(
+        b"#elea21#xx#\xff\xfegarbageelea21#12#1@0@45@27#elea21#8#3@0@45@27#"
+    )
+
+
+def test_unterminated_last_frame_needs_final():
+    assert decode_all(b"elea30#1#2")[1] == []
+    assert decode_all(b"elea30#1#2", final=True)[1] == [(30, "2")]
+
+
+def test_client_resynchronises_without_reconnecting():
+    async def fake_growcube(reader, writer):
+        for chunk in (
+            b"elea24#11#3.6@40",
+            b"63809#\x00\x00elea21#1",
+            b"x#garbage#elea21#10#0@82@45@27#ele",
+            b"a21#9#1@0@45@27#",
+        ):
+            writer.write(chunk)
+            await writer.drain()
+            await asyncio.sleep(0.01)
+        await reader.read()
+
+    async def run():
+        server = await asyncio.start_server(fake_growcube, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            client = MessageClient("127.0.0.1", port)
+            await client.connect()
+            timeout = TimeoutHelper(2)
+            messages = [await client.receive_message(timeout) for _ in range(3)]
+            await client.close()
+        return client, messages
+
+    client, messages = asyncio.run(run())
+    assert [message.message_content for message in messages] == [
+        "3.6@4063809",
+        "0@82@45@27",
+        "1@0@45@27",
+    ]
+    assert client.skipped_bytes == len(b"elea21#1x#garbage#")
+
+
+def test_get_status_stops_when_growcube_closes(monkeypatch):
+    calls = []
+    receive_message = MessageClient.receive_message
+
+    async def counting_receive_message(self, timeout):
+        calls.append(timeout)
+        return await receive_message(self, timeout)
+
+    async def fake_growcube(reader, writer):
+        await reader.read(1024)
+        writer.write(b"elea24#11#3.6@4063809#elea21#10#0@82@45@27#")
+        await writer.drain()
+        writer.close()
+
+    async def run():
+        server = await asyncio.start_server(fake_growcube, "127.0.0.1", 0)
+        monkeypatch.setattr(pygrowcube, "PORT", server.sockets[0].getsockname()[1])
+        async with server:
+            return await pygrowcube.get_status("127.0.0.1", 2)
+
+    monkeypatch.setattr(MessageClient, "receive_message", counting_receive_message)
+    status = asyncio.run(run())
+    assert status.moistures[0] == 82
+    assert len(calls) == 3
+
+
+def test_client_raises_once_closed():
+    async def fake_growcube(reader, writer):
+        writer.write(b"elea30#1#2")  # last frame without its trailing #
+        await writer.drain()
+        writer.close()
+
+    async def run():
+        server = await asyncio.start_server(fake_growcube, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            client = MessageClient("127.0.0.1", port)
+            await client.connect()
+            message = await client.receive_message(TimeoutHelper(2))
+            with pytest.raises(ConnectionError):
+                await client.receive_message(TimeoutHelper(2))
+            with pytest.raises(ConnectionError):
+                await client.receive_message(TimeoutHelper(2))
+            await client.close()
+        return client, message
+
+    client, message = asyncio.run(run())
+    assert message.message_content == "2"
+    assert client.at_eof
@@ -0,0 +1,37 @@
+"""Tests for opt-in session profiling."""
+import asyncio
+import os
+
+from pygrowcube.profiling import profile_session
+
+
+def test_profile_session_writes_files(tmp_path):
+    async def child():
+        await asyncio.sleep(0.05)
+
+    async def main():
+        await asyncio.gather(child(), child())
+
+    prefix = str(tmp_path / "session")
+    policy = asyncio.get_event_loop_policy()
+    with profile_session(prefix, trace_malloc=True) as session:
+        asyncio.run(main())
+
+    assert "new_event_loop" not in vars(policy)
+    for suffix in (".prof", ".prof.txt", ".alloc.txt", ".tasks.txt"):
+        assert prefix + suffix in session.files
+        assert os.path.getsize(prefix + suffix) > 0
+    count, wall, running = session.task_timings.timings[
+        "test_profile_session_writes_files.<locals>.child"
+    ]
+    assert count == 2
+    assert wall >= 0.05
+    assert running < wall
+
+
+def test_profile_session_only_writes_what_was_enabled(tmp_path):
+    prefix = str(tmp_path / "session")
+    with profile_session(prefix, cprofile=False, task_timing=False) as session:
+        sum(range(1000))
+    assert session.files == []
+    assert not os.listdir(tmp_path)
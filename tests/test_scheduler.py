@@ -0,0 +1,39 @@
+"""Tests for cycle-aligned poll scheduling."""
+import pytest
+
+from pygrowcube.scheduler import PhaseEstimator, PollScheduler
+
+
+def test_phase_and_drift_learned():
+    estimator = PhaseEstimator(period=10.0)
+    # Device really cycles every 10.1s starting at t=3.0
+    for cycle in range(0, 200, 7):
+        estimator.observe(3.0 + cycle * 10.1)
+    assert estimator.period == pytest.approx(10.1, abs=0.01)
+    assert estimator.next_cycle(2000.0) == pytest.approx(3.0 + 198 * 10.1, abs=0.2)
+
+
+def test_connect_just_before_cycle():
+    scheduler = PollScheduler(lead=1.0)
+    scheduler.observe("cube", 1003.0)
+    assert scheduler.schedule("cube", earliest=1010.0) == pytest.approx(1012.0)
+
+
+def test_connections_spread_on_same_access_point():
+    scheduler = PollScheduler(lead=1.0, min_spacing=0.5)
+    for host in ("a", "b", "c"):
+        scheduler.observe(host, 1005.0)
+    times = sorted(scheduler.schedule(host, earliest=1000.0) for host in "abc")
+    assert times[0] >= 1000.0
+    assert all(later - earlier >= 0.5 for earlier, later in zip(times, times[1:]))
+
+
+def test_cycle_start_learned_from_readings():
+    scheduler = PollScheduler(lead=1.0)
+    # Two sessions: each cycle's four readings arrive within a fraction of a second
+    for cycle_start in (1003.0, 1013.0, 1053.0):
+        for channel in range(4):
+            scheduler.observe_reading("cube", cycle_start + channel * 0.05)
+    estimator = scheduler.estimator("cube")
+    assert estimator.observations == 3
+    assert estimator.next_cycle(1060.0) == pytest.approx(1063.0, abs=0.05)
@@ -0,0 +1,196 @@
+"""Tests for batching output sinks."""
+import asyncio
+import csv
+import json
+import socket
+import sqlite3
+import threading
+
+from pygrowcube import sinks
+from pygrowcube.pygrowcube import Reading
+
+DAY = 1693267200  # 2023-08-29 00:00 UTC
+
+
+def readings(count, start=DAY):
+    return [
+        Reading("4063809", start + i * 10, i % 4, 80, 45, 27, 0) for i in range(count)
+    ]
+
+
+def feed(sink, records):
+    async def run():
+        async with sink:
+            for record in records:
+                await sink.put(record)
+
+    asyncio.run(run())
+
+
+def test_csv_batched_and_rotated(tmp_path):
+    sink = sinks.CsvSink(str(tmp_path / "readings-%Y-%m-%d.csv"), batch_size=100)
+    feed(sink, readings(250, start=DAY + 86400 - 500))
+    assert sink.batches == 3
+    with open(tmp_path / "readings-2023-08-29.csv") as f:
+        rows = list(csv.reader(f))
+    assert rows[0][:3] == ["time", "device", "timestamp"]
+    assert len(rows) == 51
+    assert (tmp_path / "readings-2023-08-30.csv").exists()
+
+
+def test_ndjson_and_sqlite(tmp_path):
+    ndjson = sinks.NdjsonSink(str(tmp_path / "readings.ndjson"))
+    feed(ndjson, readings(5))
+    with open(tmp_path / "readings.ndjson") as f:
+        assert json.loads(f.readline())["time"] == "2023-08-29T00:00:00+00:00"
+
+    sqlite = sinks.SqliteSink(str(tmp_path / "readings.db"), batch_size=2)
+    feed(sqlite, readings(5))
+    connection = sqlite3.connect(str(tmp_path / "readings.db"))
+    assert connection.execute(
+        "SELECT COUNT(*), MAX(channel) FROM readings"
+    ).fetchone() == (5, 3)
+    connection.close()
+
+
+def test_backpressure():
+    class SlowSink(sinks.Sink):
+        def write_batch(self, records):
+            threading.Event().wait(0.05)
+
+    async def run():
+        sink = SlowSink(batch_size=1, max_pending=2)
+        waits = []
+        for record in readings(6):
+            started = loop_time()
+            await sink.put(record)
+            waits.append(loop_time() - started)
+        # The worker can't keep up, so put() has to wait for it
+        assert max(waits) >= 0.03
+        await sink.close()
+        return sink
+
+    assert asyncio.run(run()).written == 6
+
+
+def loop_time():
+    return asyncio.get_running_loop().time()
+
+
+def test_failed_batch_retried_while_put_waits():
+    class FlakySink(sinks.Sink):
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self.down = True
+            self.records = []
+
+        def write_batch(self, records):
+            if self.down:
+                raise ConnectionError("broker down")
+            self.records.extend(records)
+
+    async def run():
+        sink = FlakySink(batch_size=1, max_pending=1, retry_delay=0.01)
+        for record in readings(2):
+            await sink.put(record)
+        # The failed batch is retried and the queue is full: put() must wait
+        blocked = asyncio.ensure_future(sink.put(readings(3)[2]))
+        await asyncio.sleep(0.1)
+        assert not blocked.done()
+        assert sink.failures >= 2
+        sink.down = False
+        await blocked
+        await sink.close()
+        return sink
+
+    sink = asyncio.run(run())
+    assert sink.records == readings(3)
+    assert sink.dropped == 0
+
+
+def test_batch_dropped_after_max_retries():
+    class BrokenSink(sinks.Sink):
+        def write_batch(self, records):
+            raise ConnectionError("broker down")
+
+    sink = BrokenSink(batch_size=2, max_retries=2, retry_delay=0.01)
+    feed(sink, readings(4))
+    assert sink.failures == 6
+    assert sink.dropped == 4
+
+
+class MqttBrokerStandIn(threading.Thread):
+    """Accepts one client, acknowledges CONNECT and collects PUBLISH packets."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.server = socket.socket()
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+        self.published = []
+
+    def run(self):
+        connection, _ = self.server.accept()
+        with connection:
+            stream = connection.makefile("rb")
+            while True:
+                header = stream.read(1)
+                if not header:
+                    return
+                length, shift = 0, 0
+                while True:
+                    byte = stream.read(1)[0]
+                    length += (byte & 0x7F) << shift
+                    shift += 7
+                    if not byte & 0x80:
+                        break
+                body = stream.read(length)
+                if header[0] == 0x10:
+                    connection.sendall(b"\x20\x02\x00\x00")
+                elif header[0] & 0xF0 == 0x30:
+                    topic_length = int.from_bytes(body[:2], "big")
+                    topic = body[2 : 2 + topic_length].decode()
+                    self.published.append((topic, json.loads(body[2 + topic_length :])))
+                elif header[0] == 0xE0:
+                    return
+
+
+def test_mqtt_publish():
+    broker = MqttBrokerStandIn()
+    broker.start()
+    feed(sinks.MqttSink("127.0.0.1", broker.port), readings(4))
+    broker.join(5)
+    assert [topic for topic, _ in broker.published] == [
+        "growcube/4063809/0",
+        "growcube/4063809/1",
+        "growcube/4063809/2",
+        "growcube/4063809/3",
+    ]
+    assert broker.published[0][1]["moisture"] == 80
+
+
+def test_csv_retry_does_not_duplicate_rows(tmp_path):
+    class FlakyCsvSink(sinks.CsvSink):
+        calls = 0
+
+        def _write_record(self, file, reading):
+            self.calls += 1
+            if self.calls == 4:
+                raise OSError("disk full")
+            super()._write_record(file, reading)
+
+    sink = FlakyCsvSink(
+        str(tmp_path / "readings-%Y-%m-%d.csv"), batch_size=6, retry_delay=0.01
+    )
+    feed(sink, readings(6, start=DAY + 86400 - 20))
+    assert sink.failures == 1
+    rows = []
+    for day in ("2023-08-29", "2023-08-30"):
+        with open(tmp_path / f"readings-{day}.csv") as f:
+            file_rows = list(csv.reader(f))
+        assert file_rows[0][0] == "time"
+        rows += file_rows[1:]
+    assert [int(row[2]) for row in rows] == [
+        r.timestamp for r in readings(6, DAY + 86400 - 20)
+    ]
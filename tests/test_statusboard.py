@@ -0,0 +1,72 @@
+"""Tests for the shared-memory status board."""
+import multiprocessing
+import subprocess
+import sys
+
+from pygrowcube.pygrowcube import Status
+from pygrowcube.statusboard import StatusBoard
+
+
+def make_status(id, moisture):
+    status = Status(
+        temperature=27, humidity=45, id=id, host="192.168.1.20", version="3.6"
+    )
+    status.moistures = [moisture, 0, 0, 0]
+    status.refreshed_sensors = [True, True, False, True]
+    status.outlet_locks[2] = True
+    return status
+
+
+def read_moisture(name, device_id, queue):
+    board = StatusBoard.attach(name)
+    queue.put(board.get(device_id).moistures[0])
+    board.close()
+
+
+def test_publish_and_read_between_processes():
+    board = StatusBoard.create(slots=8)
+    try:
+        board.publish(make_status("4063809", 82), updated=100.0)
+        board.publish(make_status("4063810", 50))
+        board.publish(make_status("4063809", 83))
+
+        queue = multiprocessing.get_context("spawn").Queue()
+        process = multiprocessing.get_context("spawn").Process(
+            target=read_moisture, args=(board.name, "4063809", queue)
+        )
+        process.start()
+        assert queue.get(timeout=30) == 83
+        process.join(30)
+
+        reader = StatusBoard.attach(board.name)
+        entry = reader.get("4063810")
+        assert entry.outlet_locks == [False, False, True, False]
+        assert entry.refreshed_sensors == [True, True, False, True]
+        assert reader.get("missing") is None
+        assert set(reader.snapshot()) == {"4063809", "4063810"}
+        status = StatusBoard.to_status(entry)
+        assert status.moistures[0] == 50 and status.version == "3.6"
+        reader.close()
+    finally:
+        board.close()
+
+
+def test_board_survives_separate_reader_processes():
+    board = StatusBoard.create(slots=8)
+    try:
+        board.publish(make_status("4063809", 82))
+        code = (
+            "import sys; from pygrowcube.statusboard import StatusBoard; "
+            "board = StatusBoard.attach(sys.argv[1]); "
+            "print(board.get('4063809').moistures[0]); board.close()"
+        )
+        for _ in range(2):
+            output = subprocess.run(
+                [sys.executable, "-c", code, board.name],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            assert output.strip() == "82"
+    finally:
+        board.close()
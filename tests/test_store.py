@@ -0,0 +1,98 @@
+"""Tests for the binary time series store."""
+import os
+
+import pytest
+
+from pygrowcube import store
+from pygrowcube.pygrowcube import FLAG_SENSOR_DISCONNECTED, Reading
+
+DAY = 1693267200  # 2023-08-29 00:00 UTC
+
+
+def make_readings(start, count, device="4063809"):
+    return [
+        Reading(device, start + i * 10, i % 4, 80 + i % 3, 45, 27, 0)
+        for i in range(count)
+    ]
+
+
+def test_records_segmented_by_day(tmp_path):
+    db = store.TimeSeriesStore(str(tmp_path))
+    db.append(make_readings(DAY + 86400 - 100, 20))
+    assert sorted(os.listdir(tmp_path)) == [
+        "2023-08-29.gcts",
+        "2023-08-30.gcts",
+        "devices.json",
+    ]
+    assert os.path.getsize(tmp_path / "2023-08-29.gcts") == (
+        store.HEADER_SIZE + 10 * store.RECORD_SIZE
+    )
+
+
+def test_range_query_and_reopen(tmp_path):
+    db = store.TimeSeriesStore(str(tmp_path))
+    readings = make_readings(DAY, 100)
+    readings.append(Reading("other", DAY + 55, 2, 0, 45, -3, FLAG_SENSOR_DISCONNECTED))
+    db.append(readings)
+
+    db = store.TimeSeriesStore(str(tmp_path))
+    records = db.query(DAY + 50, DAY + 100)
+    assert len(records) == 6
+    assert db.to_readings(db.query(DAY, DAY + 86400, device="other")) == [readings[-1]]
+    assert len(db.query(DAY, DAY + 86400, channel=1)) == 25
+
+
+def test_query_without_numpy(tmp_path, monkeypatch):
+    db = store.TimeSeriesStore(str(tmp_path))
+    readings = make_readings(DAY, 40)
+    db.append(readings)
+    monkeypatch.setattr(store, "numpy", None)
+    assert db.query(DAY + 100, DAY + 150) == readings[10:15]
+
+
+def test_array_query_is_zero_copy(tmp_path):
+    numpy = pytest.importorskip("numpy")
+    db = store.TimeSeriesStore(str(tmp_path))
+    db.append(make_readings(DAY, 1000))
+    (records,) = db.query_arrays(DAY, DAY + 500)
+    assert not records.flags.owndata
+    assert len(records) == 50
+    assert numpy.all(numpy.diff(records["timestamp"].astype(int)) == 10)
+
+
+def test_reader_sees_devices_registered_after_it_opened(tmp_path, monkeypatch):
+    writer = store.TimeSeriesStore(str(tmp_path))
+    writer.append(make_readings(DAY, 4))
+    reader = store.TimeSeriesStore(str(tmp_path))
+    later = make_readings(DAY + 100, 4, device="4063810")
+    writer.append(later)
+
+    assert reader.to_readings(reader.query(DAY, DAY + 200, device="4063810")) == later
+    monkeypatch.setattr(store, "numpy", None)
+    assert reader.query(DAY + 100, DAY + 200) == later
+
+
+def test_range_query_only_opens_existing_segments(tmp_path, monkeypatch):
+    db = store.TimeSeriesStore(str(tmp_path))
+    readings = make_readings(DAY, 4) + make_readings(DAY + 3 * 86400, 4)
+    db.append(readings)
+    opened = []
+    segment = db._segment
+    monkeypatch.setattr(db, "_segment", lambda day: opened.append(day) or segment(day))
+    monkeypatch.setattr(store, "numpy", None)
+    assert db.query(0, 2**32) == readings
+    assert opened == [DAY, DAY + 3 * 86400]
+
+
+def test_append_after_torn_write(tmp_path):
+    db = store.TimeSeriesStore(str(tmp_path))
+    readings = make_readings(DAY, 3)
+    db.append(readings[:2])
+    with open(tmp_path / "2023-08-29.gcts", "ab") as f:
+        f.write(b"\x01\x02\x03\x04\x05")  # half a record from an interrupted write
+    db = store.TimeSeriesStore(str(tmp_path))
+    db.append(readings[2:])
+    assert os.path.getsize(tmp_path / "2023-08-29.gcts") == (
+        store.HEADER_SIZE + 3 * store.RECORD_SIZE
+    )
+    assert db.to_readings(db.query(DAY, DAY + 86400)) == readings
@@ -0,0 +1,45 @@
+"""Tests for the connection trace buffer."""
+import asyncio
+import logging
+
+import pytest
+
+from pygrowcube.messageclient import MessageClient
+from pygrowcube.timeouthelper import TimeoutHelper
+from pygrowcube.trace import TraceBuffer
+
+
+def test_ring_buffer_is_bounded():
+    trace = TraceBuffer(size=3, name="cube")
+    for i in range(10):
+        trace.record("rx", f"frame {i}")
+    assert len(trace) == 3
+    assert "frame 9" in trace.format()
+    assert "frame 6" not in trace.format()
+
+
+def test_trace_dumped_on_parse_error(caplog):
+    async def fake_growcube(reader, writer):
+        writer.write(b"elea24#11#3.6@4063809#elea21#xx#")
+        await writer.drain()
+        await asyncio.sleep(0.5)
+        writer.close()
+
+    async def run():
+        server = await asyncio.start_server(fake_growcube, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            client = MessageClient("127.0.0.1", port, trace_size=10)
+            await client.connect()
+            first = await client.receive_message(TimeoutHelper(2))
+            # The corrupt frame is skipped, then the connection closes
+            with pytest.raises(ConnectionError):
+                await client.receive_message(TimeoutHelper(2))
+            await client.close()
+        return client, first
+
+    with caplog.at_level(logging.WARNING, logger="pygrowcube.trace"):
+        client, first = asyncio.run(run())
+    assert first.message_content == "3.6@4063809"
+    assert client.trace.dumps == 1
+    assert "elea24#11#3.6@4063809#" in caplog.text